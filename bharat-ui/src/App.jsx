@@ -7,6 +7,7 @@ export default function BharatUI() {
   const [question, setQuestion] = useState("");
   const [currentResponse, setCurrentResponse] = useState([]);
   const [currentStage, setCurrentStage] = useState("");
+  const [liveText, setLiveText] = useState({});
   const scrollRef = useRef(null);
 
   const stageOrder = [
@@ -20,10 +21,14 @@ export default function BharatUI() {
     "done",
   ];
 
+  // heads that stream partial tokens as `<head>_delta` events
+  const streamingHeads = ["head1", "head2", "head3"];
+
   const ask = async (q) => {
     if (!q.trim() || loading) return;
     setLoading(true);
     setCurrentResponse([]);
+    setLiveText({});
     setCurrentStage("status");
 
     const evt = new EventSource(`http://127.0.0.1:8000/query?query=${encodeURIComponent(q)}`);
@@ -31,8 +36,39 @@ export default function BharatUI() {
     const pushStage = (type, data) => {
       setCurrentResponse((r) => [...r, { type, data }]);
       setCurrentStage(type);
+      // final event replaces the live buffer for that head
+      setLiveText((t) => {
+        if (!(type in t)) return t;
+        const { [type]: _, ...rest } = t;
+        return rest;
+      });
     };
 
+    // server is busy: show our place in line until the pipeline starts
+    evt.addEventListener("queue", (e) => {
+      const data = JSON.parse(e.data);
+      setCurrentResponse((r) => [...r.filter((s) => s.type !== "queue"), { type: "queue", data }]);
+    });
+
+    // queue is full: the server says so in-stream, then sends "done"
+    evt.addEventListener("busy", (e) => {
+      setCurrentResponse((r) => [...r, { type: "busy", data: JSON.parse(e.data) }]);
+    });
+
+    // answer served from the semantic cache: the stage events that follow are a replay
+    evt.addEventListener("cache", (e) => {
+      const data = JSON.parse(e.data);
+      if (data.hit) setCurrentResponse((r) => [...r, { type: "cache", data }]);
+    });
+
+    streamingHeads.forEach((h) =>
+      evt.addEventListener(`${h}_delta`, (e) => {
+        const { delta } = JSON.parse(e.data);
+        setLiveText((t) => ({ ...t, [h]: (t[h] || "") + delta }));
+        setCurrentStage(h);
+      })
+    );
+
     stageOrder.forEach((t) =>
       evt.addEventListener(t, (e) => pushStage(t, JSON.parse(e.data)))
     );
@@ -46,6 +82,10 @@ export default function BharatUI() {
     evt.onerror = () => {
       evt.close();
       setLoading(false);
+      setCurrentResponse((r) => [
+        ...r,
+        { type: "error", data: { message: "Lost connection to the server. Try again shortly." } },
+      ]);
     };
   };
 
@@ -54,7 +94,7 @@ export default function BharatUI() {
     if (scrollRef.current) {
       scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
     }
-  }, [currentResponse]);
+  }, [currentResponse, liveText]);
 
   const currentIndex = stageOrder.indexOf(currentStage);
 
@@ -69,7 +109,7 @@ export default function BharatUI() {
 
       <div className="content-container">
         {/* floating output box */}
-        {currentResponse.length > 0 && (
+        {(currentResponse.length > 0 || Object.keys(liveText).length > 0) && (
           <div className="floating-box">
             <div className="scrollable-content" ref={scrollRef}>
               {currentResponse.map((s, i) => (
@@ -78,6 +118,12 @@ export default function BharatUI() {
                   <pre>{JSON.stringify(s.data, null, 2)}</pre>
                 </div>
               ))}
+              {Object.entries(liveText).map(([h, text]) => (
+                <div key={`live-${h}`} className="stage-line">
+                  <strong>{h.toUpperCase()} …</strong>
+                  <pre>{text}</pre>
+                </div>
+              ))}
             </div>
           </div>
         )}
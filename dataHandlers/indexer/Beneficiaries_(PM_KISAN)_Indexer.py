@@ -131,6 +131,13 @@ def build_agriculture_index():
     print(f"✅ Wrote {len(state_map)} state files with {total} total entries")
     print(f"✅ Root index: {INDEX_PATH}")
 
+    # precompute the selector's key embeddings now rather than on the first query
+    try:
+        from intelligence.llm_tools.pmkisan_index import build_pmkisan_index
+        build_pmkisan_index(index_data)
+    except ImportError as e:
+        print(f"⚠️ Skipped PM-KISAN key embeddings: {e}")
+
 # ---------------------- ENTRYPOINT ----------------------
 if __name__ == "__main__":
     build_agriculture_index()
@@ -1,9 +1,10 @@
 # intelligence/heads/head1_planner.py
-import ollama
 from .selfCritique import DatasetRegistry
+from ..llm_tools.local_llm import LocalLLM
 class Head1Planner:
     def __init__(self, model="mistral-nemo:12b"):
         self.model = model
+        self.llm = LocalLLM(model=model)
 
     def make_prompt(self, query: str, registry: DatasetRegistry) -> str:
         """
@@ -25,13 +26,18 @@ class Head1Planner:
             ---
             Query: {query}
             Here is a summary of available DataFrames:
-            {registry.describe_all()}
+            {registry.describe_compact()}
         """
         return prompt.strip()
 
     def plan(self, query: str, registry: DatasetRegistry) -> str:
         prompt = self.make_prompt(query, registry=registry)
         # breakpoint()
-        response = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}]) # 3min 33sec
+        response = self.llm.chat(prompt) # 3min 33sec
         # breakpoint()
-        return response["message"]["content"].strip()
+        return response
+
+    def plan_stream(self, query: str, registry: DatasetRegistry):
+        """Yields the plan text piece by piece as the model generates it."""
+        prompt = self.make_prompt(query, registry=registry)
+        yield from self.llm.stream(prompt)
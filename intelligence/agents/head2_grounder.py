@@ -1,17 +1,12 @@
 import json, ast, re
-import ollama
+from ..llm_tools.local_llm import LocalLLM
 from typing import Any, List, Dict
 
 FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)```", re.IGNORECASE)
 
 class Head2Planner:
-    def __init__(self,
-                 reasoning_model: str = "mistral-nemo:12b",
-                 coder_model: str = "deepseek-coder:6.7b",
-                 use_refiner: bool = True):
+    def __init__(self, reasoning_model: str = "mistral-nemo:12b"):
         self.reasoning_model = reasoning_model
-        self.coder_model = coder_model
-        self.use_refiner = use_refiner
 
     # ----------------- prompt -----------------
     def build_prompt(self, plan, dataset_meta) -> str:
@@ -33,22 +28,35 @@ class Head2Planner:
         - Use only column names that exist in the provided META.
         """.strip()
 
+    # ----------------- output schema -----------------
+    def ops_schema(self, dataset_meta) -> dict:
+        """JSON schema for the op array; column names limited to the META."""
+        columns = sorted({c for d in dataset_meta for c in d.get("columns", [])})
+        col = {"enum": columns} if columns else {"type": "string"}
+        return {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "step": {"type": "integer"},
+                    "op": {"type": "string"},
+                    "input": {"type": "string"},
+                    "columns": {"type": "array", "items": col},
+                    "condition": {"type": "string"},
+                    "agg": {"type": "object"},
+                    "output": {"type": "string"},
+                    "on": {"anyOf": [col, {"type": "array", "items": col}]},
+                    "how": {"enum": ["inner", "left", "right", "outer"]},
+                },
+                "required": ["step", "op", "input", "output"],
+            },
+        }
+
     # ----------------- chat wrappers -----------------
-    def _chat(self, model: str, content: str) -> str:
-        r = ollama.chat(model=model, messages=[{"role": "user", "content": content}])
-        return r.get("message", {}).get("content", "").strip()
-
-    def _refine(self, raw_text: str) -> str:
-        if not self.use_refiner or not self.coder_model:
-            return raw_text
-        prompt = f"""
-        The text below should be a valid JSON array but may include extra words or fences.
-        Return strictly the JSON only. If you see ```json fences, return only what's inside.
-
-        Text:
-        {raw_text}
-        """
-        return self._chat(self.coder_model, prompt)
+    def _chat(self, model: str, content: str, schema=None) -> str:
+        # structured output replaces the old coder-model "refiner" pass
+        return LocalLLM(model=model).chat(content, format=schema)
 
     # ----------------- JSON extraction -----------------
     def _extract_json(self, text: str) -> str:
@@ -133,24 +141,15 @@ class Head2Planner:
     def plan(self, plan, dataset_meta):
         prompt = self.build_prompt(plan, dataset_meta)
 
-        # 1) reasoning
-        raw = self._chat(self.reasoning_model, prompt)
+        # 1) reasoning, constrained to the op schema
+        raw = self._chat(self.reasoning_model, prompt, self.ops_schema(dataset_meta))
         print('############ RAW OUTPUT ############')
         print(raw)
 
-        # 2) optional refine
-        refined = self._refine(raw)
-        print('############ REFINED OUTPUT ############')
-        print(refined)
-        # 3) extract the JSON payload robustly
-        json_text = self._extract_json(refined)
-        print('############ JSON OUTPUT ############')
-        print(json_text)
-
-        # 4) parse with relaxed loader
-        ops = self._loads_relaxed(json_text)
+        # 2) extract + parse (a no-op for schema-constrained output, kept as a safety net)
+        ops = self._loads_relaxed(self._extract_json(raw))
 
-        # 5) minimal schema sanity
+        # 3) minimal schema sanity
         if isinstance(ops, list):
             self._validate_ops(ops, dataset_meta)
         else:
@@ -177,5 +176,4 @@ if __name__ == "__main__":
     result = head2.plan(plan, dataset_meta)
     print(json.dumps(result, indent=2))
     from ..llm_tools.ollama_utils import OllamaManager
-    OllamaManager.stop_model("deepseek-coder:6.7b")
     OllamaManager.stop_model("mistral-nemo:12b")
\ No newline at end of file
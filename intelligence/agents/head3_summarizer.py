@@ -1,11 +1,19 @@
-import ollama
 import pandas as pd
 from ..agents.selfCritique import DatasetRegistry
+from ..llm_tools.local_llm import LocalLLM
 class Head3Answerer:
     def __init__(self, model="mistral-nemo:12b"):
         self.model = model
+        self.llm = LocalLLM(model=model)
 
     def summarize_results(self, registry : DatasetRegistry ,results: dict, query: str):
+        return self.llm.chat(self.make_prompt(registry=registry, results=results, query=query))
+
+    def summarize_stream(self, registry : DatasetRegistry ,results: dict, query: str):
+        """Yields the summary piece by piece as the model generates it."""
+        yield from self.llm.stream(self.make_prompt(registry=registry, results=results, query=query))
+
+    def make_prompt(self, registry : DatasetRegistry ,results: dict, query: str) -> str:
         # pick the last non-empty DataFrame
         try:
             dfs = [v for v in results.values() if isinstance(v, pd.DataFrame) and not v.empty]
@@ -43,6 +51,4 @@ class Head3Answerer:
         Do NOT say that data is insufficient or uncertain.
         End with one clear concluding statement.
         """
-
-        response = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}])
-        return response["message"]["content"]
\ No newline at end of file
+        return prompt
\ No newline at end of file
@@ -0,0 +1,155 @@
+# intelligence/agents/schema_prompt.py
+"""
+Compact, token-budgeted schema text for LLM prompts.
+
+Replaces the indented JSON dump of `DatasetRegistry.describe_all` with one
+line per column (dtype, value range or top categories) and trims detail in a
+fixed order until the whole block fits the budget:
+
+    samples → top categories 5→3→1 → value width → columns per dataset
+
+Output is deterministic for the same data, so it doesn't break prompt caching.
+"""
+
+import json
+import math
+import os
+import weakref
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_BUDGET = int(os.getenv("SCHEMA_TOKEN_BUDGET", "1200"))
+
+# id(df) -> (shape, {column: stats}) for frames warmed ahead of time
+_STATS = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars/token for English + digits)."""
+    return math.ceil(len(text) / 4)
+
+
+def _short(val, width):
+    s = str(val)
+    return s if len(s) <= width else s[: width - 1] + "…"
+
+
+def _fmt_num(x):
+    if isinstance(x, (int, np.integer)) or (isinstance(x, float) and x.is_integer()):
+        return str(int(x))
+    return f"{x:.4g}"
+
+
+class SchemaRenderer:
+    """Renders registry datasets into a compact schema within a token budget."""
+
+    # detail levels tried in order until the text fits
+    LEVELS = [
+        {"samples": 2, "top": 5, "width": 40, "max_cols": None},
+        {"samples": 1, "top": 5, "width": 30, "max_cols": None},
+        {"samples": 0, "top": 5, "width": 30, "max_cols": None},
+        {"samples": 0, "top": 3, "width": 24, "max_cols": None},
+        {"samples": 0, "top": 1, "width": 20, "max_cols": None},
+        {"samples": 0, "top": 1, "width": 20, "max_cols": 24},
+        {"samples": 0, "top": 0, "width": 16, "max_cols": 12},
+    ]
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        self.budget = budget
+        self.last_report = {}
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def column_stats(s: pd.Series) -> dict:
+        """Everything column_line needs, independent of the detail level."""
+        nn = s.dropna()
+        if pd.api.types.is_bool_dtype(s):
+            kind = "bool"
+        elif pd.api.types.is_numeric_dtype(s):
+            kind = "int" if pd.api.types.is_integer_dtype(s) else "float"
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            kind = "date"
+        else:
+            kind = "str"
+            # scraped CSVs often keep numbers as text; show those as ranges too
+            as_num = pd.to_numeric(nn, errors="coerce")
+            if len(nn) and as_num.notna().mean() >= 0.9:
+                kind, nn = "num-as-str", as_num.dropna()
+        stats = {"kind": kind, "empty": nn.empty, "nulls": int(s.isna().sum())}
+        if nn.empty:
+            pass
+        elif kind in ("int", "float", "num-as-str", "date"):
+            stats["range"] = (nn.min(), nn.max())
+        else:
+            counts = nn.astype(str).value_counts()
+            stats["uniq"] = len(counts)
+            # count desc, then value asc → stable across runs
+            stats["top"] = [v for v, _ in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:5]]
+        return stats
+
+    @classmethod
+    def warm(cls, df: pd.DataFrame):
+        """Pre-compute column stats for df (e.g. while an LLM call is running)."""
+        _STATS[id(df)] = (df.shape, {c: cls.column_stats(df[c]) for c in df.columns})
+        weakref.finalize(df, _STATS.pop, id(df), None)
+
+    def column_line(self, name, s: pd.Series, top: int, width: int, stats: dict | None = None) -> str:
+        st = stats or self.column_stats(s)
+        kind = st["kind"]
+        parts = [f"{_short(name, 48)}: {kind}"]
+        if st["empty"]:
+            parts.append("all null")
+        elif kind == "date":
+            lo, hi = st["range"]
+            parts.append(f"{lo.date()}..{hi.date()}")
+        elif "range" in st:
+            lo, hi = st["range"]
+            parts.append(f"{_fmt_num(lo)}..{_fmt_num(hi)}")
+        else:
+            parts.append(f"{st['uniq']} uniq")
+            if top:
+                parts.append("top: " + " | ".join(_short(v, width) for v in st["top"][:top]))
+        if st["nulls"]:
+            parts.append(f"{st['nulls']} null")
+        return "  " + ", ".join(parts)
+
+    def render_dataset(self, name: str, df: pd.DataFrame, level: dict) -> str:
+        cols = list(df.columns)
+        shown = cols if level["max_cols"] is None else cols[: level["max_cols"]]
+        warm = _STATS.get(id(df))
+        stats = warm[1] if warm and warm[0] == df.shape else {}
+        lines = [f"{name} ({df.shape[0]} rows × {df.shape[1]} cols)"]
+        lines += [self.column_line(c, df[c], level["top"], level["width"], stats.get(c)) for c in shown]
+        if len(shown) < len(cols):
+            rest = ", ".join(_short(c, 24) for c in cols[len(shown):])
+            lines.append(f"  +{len(cols) - len(shown)} more: {rest}")
+        if level["samples"]:
+            for row in df.head(level["samples"]).to_dict(orient="records"):
+                row = {str(k): _short(v, level["width"]) for k, v in list(row.items())[:12]}
+                lines.append("  e.g. " + json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        return "\n".join(lines)
+
+    # ------------------------------------------------------------------
+    def render(self, datasets: dict, budget: int | None = None) -> str:
+        """
+        Returns the schema text. `self.last_report` holds the tokens per
+        dataset section, the total, the budget and the detail level used.
+        """
+        budget = budget or self.budget
+        frames = {n: df for n, df in datasets.items() if isinstance(df, pd.DataFrame)}
+        sections = {}
+        for li, level in enumerate(self.LEVELS):
+            sections = {n: self.render_dataset(n, df, level) for n, df in frames.items()}
+            total = sum(estimate_tokens(t) for t in sections.values())
+            if total <= budget:
+                break
+        text = "\n\n".join(sections.values())
+        self.last_report = {
+            "sections": {n: estimate_tokens(t) for n, t in sections.items()},
+            "total": estimate_tokens(text),
+            "budget": budget,
+            "level": li,
+            "fits": estimate_tokens(text) <= budget,
+        }
+        return text
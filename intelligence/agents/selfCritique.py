@@ -12,7 +12,8 @@ import io, json, traceback, contextlib, re
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import ollama
+from ..llm_tools.local_llm import LocalLLM
+from .schema_prompt import SchemaRenderer
 
 
 class DatasetRegistry:
@@ -20,8 +21,15 @@ class DatasetRegistry:
 
     def __init__(self):
         self.datasets = {}
+        self.schema_report = {}
 
-    def register(self, name: str, df: pd.DataFrame):
+    def register(self, name: str, df: pd.DataFrame, prepared: bool = False):
+        # frames from the Prefetcher were already cleaned off the request path
+        self.datasets[name] = df if prepared else self.prepare(df)
+
+    @staticmethod
+    def prepare(df: pd.DataFrame) -> pd.DataFrame:
+        """Copy of df with blank markers as NaN and missing values imputed."""
         df = df.copy()
         df.replace(["NA", "NaN", "", " "], np.nan, inplace=True)
 
@@ -37,7 +45,7 @@ class DatasetRegistry:
             if df[col].isna().any():
                 df[col].fillna(df[col].mode(), inplace=True)
 
-        self.datasets[name] = df
+        return df
 
     def get(self, name: str) -> pd.DataFrame:
         return self.datasets.get(name)
@@ -61,6 +69,13 @@ class DatasetRegistry:
             summary[name] = desc
         return json.dumps(summary, indent=2)
 
+    def describe_compact(self, token_budget: int | None = None) -> str:
+        """Prompt-ready schema that fits `token_budget`; token counts land in self.schema_report."""
+        renderer = SchemaRenderer() if token_budget is None else SchemaRenderer(budget=token_budget)
+        text = renderer.render(self.datasets)
+        self.schema_report = renderer.last_report
+        return text
+
 
 class SandboxExecutor:
     """Runs arbitrary Python code safely in an isolated namespace with DataFrames."""
@@ -97,8 +112,7 @@ class SelfCritiqueAgent:
 
     def _chat(self, prompt: str) -> str:
         """Wrapper for Ollama chat call."""
-        resp = ollama.chat(model=self.coder_model, messages=[{"role": "user", "content": prompt}])
-        return resp.get("message", {}).get("content", "").strip()
+        return LocalLLM(model=self.coder_model).chat(prompt)
 
     def _extract_code(self, text: str) -> str:
         """Grab code fences or fallback to raw text."""
@@ -139,7 +153,7 @@ class SelfCritiqueAgent:
             {result['error'][:1000] if isinstance(result, dict) and 'error' in result else result}
 
             Here is a summary of available DataFrames:
-            {registry.describe_all()}
+            {registry.describe_compact()}
 
             Instructions:
             - DO NOT redefine or reload any DataFrame (D1–D5); they are already in memory.
@@ -1,5 +1,6 @@
 # intelligence/llm_tools/analysis_orchestrator.py
 import json
+from functools import partial
 from pathlib import Path
 from .llm_tools.dataset_search_tool import DatasetSearchTool
 
@@ -25,9 +26,10 @@ class AnalysisOrchestrator:
         """
         return self.dataset_selector.select(user_query)
     
-    def select_files(self, query: str, selected_families: list[str]):
+    def select_files(self, query: str, selected_families: list[str], prefetcher=None):
         """
         Given family/families (from stage 1) and query, select specific dataset files.
+        If a Prefetcher is given, retrieval candidates start loading while the LLM re-ranks.
         Returns dict: {"selected_files": [...]}
         """
         from .llm_tools.file_selector import FileSearchTool
@@ -49,7 +51,7 @@ class AnalysisOrchestrator:
             # normal selector (id, title based)
             data = json.load(open(path))
             tool = FileSearchTool(data)
-            res = tool.select(query)
+            res = tool.select(query, on_candidates=prefetcher and partial(prefetcher.submit, family))
             results.append({family: res})
 
         return {"selected_files": results}
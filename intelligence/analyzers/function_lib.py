@@ -1,10 +1,22 @@
+import threading
+
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import LinearRegression
 
+# per thread: concurrent pipelines run steps on different CPU_POOL workers
+_copies = threading.local()
+
 def safe(df):
     """Return a defensive copy of df."""
-    return df.copy() if isinstance(df, pd.DataFrame) else df
+    if isinstance(df, pd.DataFrame):
+        _copies.n = getattr(_copies, "n", 0) + 1
+        return df.copy()
+    return df
+
+def _copies_made():
+    """Number of defensive copies taken so far on this thread (for profiling)."""
+    return getattr(_copies, "n", 0)
 
 # --- Filtering & Cleaning -------------------------------------------------
 def parseDf(df):
@@ -0,0 +1,414 @@
+# intelligence/analyzers/plan_checker.py
+"""
+Static checker for Head-2 operation sequences.
+
+Walks the op list once, infers the output columns of every `function_lib`
+call and reports unknown functions, inputs, arguments and columns before
+anything executes. Column typos in column-name arguments are repaired from
+the nearest known name (case-insensitive match first, then difflib) — no
+LLM involved. Identifiers inside expressions are only reported.
+"""
+
+import difflib
+import inspect
+import re
+from dataclasses import dataclass
+
+from . import function_lib
+
+
+@dataclass
+class PlanIssue:
+    step: int              # 0-based index in the op list
+    kind: str              # bad_format | unknown_function | unknown_input | bad_argument | unknown_column
+    message: str
+    suggestion: str | None = None
+    fatal: bool = True     # False for issues the executor tolerates anyway
+    arg: str | None = None # kwarg holding the unknown column (column-name args only)
+
+
+# kwargs that hold column names (str, list of str or mapping keys)
+COLUMN_ARGS = {
+    "drop_missing": ("cols",),
+    "fill_missing": ("cols",),
+    "rename_columns": ("mapping",),
+    "select_columns": ("cols",),
+    "sort_rows": ("by",),
+    "remove_duplicates": ("subset",),
+    "filter_date_range": ("col",),
+    "group_by_mean": ("key", "cols"),
+    "group_by_sum": ("key", "cols"),
+    "group_by_median": ("key", "cols"),
+    "group_by_count": ("key",),
+    "aggregate_multiple": ("key", "agg_map"),
+    "pivot_table": ("index", "columns", "values"),
+    "merge_dfs": ("on",),
+    "lookup_value": ("key_col", "target_col"),
+    "yearly_trend": ("year_col", "value_col"),
+    "moving_average": ("col",),
+    "percentage_change": ("col",),
+    "normalize_column": ("col",),
+    "standardize_column": ("col",),
+    "detect_outliers": ("col",),
+    "aggregate_trend": ("group_col", "value_col"),
+    "compare_means": ("group_col", "value_col"),
+}
+
+# column args the executor skips when unknown (select_columns drops them,
+# filter_date_range returns the frame unchanged, rename ignores missing keys)
+TOLERANT_COLUMN_ARGS = {
+    "select_columns": ("cols",),
+    "filter_date_range": ("col",),
+    "rename_columns": ("mapping",),
+}
+
+# kwargs that hold pandas query/eval expressions
+EXPR_ARGS = {
+    "filter_rows": ("condition",),
+    "add_computed_column": ("expr",),
+}
+
+# functions whose first positional arg is a list of frames
+MULTI_INPUT = {"merge_dfs", "concat_dfs", "align_columns", "compute_correlation"}
+
+_EXPR_WORDS = {"and", "or", "not", "in", "is", "True", "False", "None", "nan", "inf"}
+_IDENT_RE = re.compile(r"`([^`]+)`|(?<![\w.@])([A-Za-z_]\w*)")
+_STRING_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        return list(value.keys())
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _dedupe(cols):
+    return list(dict.fromkeys(cols))
+
+
+def expr_columns(expr: str) -> list[str]:
+    """Column-like identifiers used in a pandas query/eval expression."""
+    stripped = _STRING_RE.sub("''", expr)
+    names = []
+    for m in _IDENT_RE.finditer(stripped):
+        name = m.group(1) or m.group(2)
+        if name in _EXPR_WORDS:
+            continue
+        # skip method calls such as .str.contains(...) / abs(...)
+        if m.group(2) and stripped[m.end():].lstrip().startswith("("):
+            continue
+        names.append(name)
+    return names
+
+
+def nearest_column(name: str, columns: list[str]) -> str | None:
+    """Best-guess replacement for an unknown column name."""
+    if not isinstance(name, str) or not columns:
+        return None
+    lowered = {str(c).lower().strip(): c for c in columns}
+    hit = lowered.get(name.lower().strip())
+    if hit is not None:
+        return hit
+    norm = {re.sub(r"[\W_]+", "", str(c).lower()): c for c in columns}
+    hit = norm.get(re.sub(r"[\W_]+", "", name.lower()))
+    if hit is not None:
+        return hit
+    close = difflib.get_close_matches(name, [str(c) for c in columns], n=1, cutoff=0.75)
+    return close[0] if close else None
+
+
+# --- output schema rules ---------------------------------------------------
+# Each rule: (input_columns, kwargs) -> output columns, or None when the
+# result's columns depend on the data (pivot, describe) or it isn't a frame.
+
+def _passthrough(cols, kw):
+    return cols
+
+
+def _grouped(cols, kw):
+    return _dedupe(_as_list(kw.get("key")) + _as_list(kw.get("cols")))
+
+
+def _renamed(cols, kw):
+    mapping = kw.get("mapping") or {}
+    return [mapping.get(c, c) for c in cols]
+
+
+def _selected(cols, kw):
+    return [c for c in _as_list(kw.get("cols")) if c in cols]
+
+
+def _with(suffix_fn):
+    def rule(cols, kw):
+        return _dedupe(cols + [suffix_fn(kw)])
+    return rule
+
+
+def _merged(inputs, kw):
+    if len(inputs) != 2 or None in inputs:
+        return None
+    left, right = inputs
+    on = set(_as_list(kw.get("on")))
+    overlap = (set(left) & set(right)) - on
+    out = [f"{c}_x" if c in overlap else c for c in left]
+    out += [f"{c}_y" if c in overlap else c for c in right if c not in on]
+    return out
+
+
+def _concatenated(inputs, kw):
+    if None in inputs:
+        return None
+    if kw.get("axis", 0) in (1, "columns"):
+        return [c for cols in inputs for c in cols]
+    return _dedupe([c for cols in inputs for c in cols])
+
+
+def _correlated(inputs, kw):
+    if len(inputs) != 2 or None in inputs:
+        return None
+    return ([c for c in _as_list(kw.get("cols1")) if c in inputs[0]]
+            + [c for c in _as_list(kw.get("cols2")) if c in inputs[1]])
+
+
+OUTPUT_RULES = {
+    "parseDf": _passthrough,
+    "safe": _passthrough,
+    "filter_rows": _passthrough,
+    "drop_missing": _passthrough,
+    "fill_missing": _passthrough,
+    "rename_columns": _renamed,
+    "select_columns": _selected,
+    "sort_rows": _passthrough,
+    "remove_duplicates": _passthrough,
+    "filter_date_range": _passthrough,
+    "group_by_mean": _grouped,
+    "group_by_sum": _grouped,
+    "group_by_median": _grouped,
+    "group_by_count": lambda cols, kw: _dedupe(_as_list(kw.get("key")) + ["count"]),
+    "aggregate_multiple": lambda cols, kw: (
+        None if any(isinstance(v, (list, tuple)) for v in (kw.get("agg_map") or {}).values())
+        else _dedupe(_as_list(kw.get("key")) + _as_list(kw.get("agg_map")))
+    ),
+    "pivot_table": lambda cols, kw: None,
+    "flatten_multiindex": lambda cols, kw: None,
+    "lookup_value": lambda cols, kw: None,
+    "add_computed_column": _with(lambda kw: kw.get("new_col")),
+    "yearly_trend": _with(lambda kw: "trend"),
+    "moving_average": _with(lambda kw: f"{kw.get('col')}_ma{kw.get('window', 3)}"),
+    "percentage_change": _with(lambda kw: f"{kw.get('col')}_pct_change"),
+    "normalize_column": _passthrough,
+    "standardize_column": _passthrough,
+    "describe_stats": lambda cols, kw: None,
+    "detect_outliers": _passthrough,
+    "aggregate_trend": lambda cols, kw: [kw.get("group_col"), "trend_slope"],
+    "compare_means": lambda cols, kw: [kw.get("group_col"), kw.get("value_col")],
+}
+
+MULTI_OUTPUT_RULES = {
+    "merge_dfs": _merged,
+    "concat_dfs": _concatenated,
+    "align_columns": lambda inputs, kw: None,
+    "compute_correlation": _correlated,
+}
+
+
+class PlanChecker:
+    """Infers per-step schemas for a Head-2 op list and validates it statically."""
+
+    def __init__(self, lib: dict | None = None):
+        self.lib = lib if lib is not None else {
+            name: getattr(function_lib, name)
+            for name in dir(function_lib)
+            if inspect.isfunction(getattr(function_lib, name)) and not name.startswith("_")
+        }
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def schemas_from(frames: dict) -> dict:
+        """name -> list of columns, for every DataFrame-like value in `frames`."""
+        return {
+            name: [str(c) for c in df.columns] if hasattr(df, "columns") else None
+            for name, df in frames.items()
+        }
+
+    # ------------------------------------------------------------------
+    def _check_args(self, i, func_name, kwargs, issues):
+        func = self.lib[func_name]
+        params = inspect.signature(func).parameters
+        accepts_any = any(p.kind is p.VAR_KEYWORD for p in params.values())
+        positional = list(params)[2 if func_name in MULTI_INPUT and func_name != "concat_dfs" else 1:]
+        for key in kwargs:
+            if not accepts_any and key not in positional:
+                hint = difflib.get_close_matches(key, positional, n=1, cutoff=0.6)
+                issues.append(PlanIssue(i, "bad_argument",
+                                        f"{func_name}() has no argument '{key}'",
+                                        hint[0] if hint else None))
+        for name in positional:
+            p = params[name]
+            if p.default is p.empty and name not in kwargs:
+                issues.append(PlanIssue(i, "bad_argument", f"{func_name}() missing argument '{name}'"))
+
+    def _check_columns(self, i, func_name, kwargs, in_cols, issues):
+        if func_name in MULTI_INPUT:
+            known = [c for cols in in_cols if cols is not None for c in cols]
+            if any(cols is None for cols in in_cols):
+                return
+        else:
+            if in_cols is None:
+                return
+            known = in_cols
+        refs = []
+        for arg in COLUMN_ARGS.get(func_name, ()):
+            refs += [(arg, c) for c in _as_list(kwargs.get(arg))]
+        exprs = []
+        for arg in EXPR_ARGS.get(func_name, ()):
+            if isinstance(kwargs.get(arg), str):
+                exprs += [(arg, c) for c in expr_columns(kwargs[arg])]
+        if func_name == "merge_dfs" and len(in_cols) == 2:
+            # join keys must exist on both sides
+            for c in _as_list(kwargs.get("on")):
+                for side in in_cols:
+                    if c not in side:
+                        issues.append(PlanIssue(i, "unknown_column",
+                                                f"merge key '{c}' missing on one side",
+                                                nearest_column(c, side), arg="on"))
+            refs = []
+        if func_name == "compute_correlation" and len(in_cols) == 2:
+            refs = []
+            for arg, side in (("cols1", in_cols[0]), ("cols2", in_cols[1])):
+                for c in _as_list(kwargs.get(arg)):
+                    if c not in side:
+                        issues.append(PlanIssue(i, "unknown_column",
+                                                f"column '{c}' not found for {arg}",
+                                                nearest_column(c, side), arg=arg))
+        tolerant = TOLERANT_COLUMN_ARGS.get(func_name, ())
+        for arg, col in refs:
+            if col not in known:
+                issues.append(PlanIssue(i, "unknown_column",
+                                        f"column '{col}' ({arg}) not in {known[:12]}",
+                                        nearest_column(col, known), fatal=arg not in tolerant, arg=arg))
+        for arg, col in exprs:
+            if col not in known:
+                # expression identifiers may be locals or helpers: warn, never rewrite
+                hint = nearest_column(col, known)
+                issues.append(PlanIssue(i, "unknown_column",
+                                        f"column '{col}' ({arg}) not in {known[:12]}"
+                                        + (f"; did you mean '{hint}'?" if hint else ""),
+                                        fatal=False))
+
+    def _output(self, func_name, kwargs, in_cols):
+        try:
+            if func_name in MULTI_OUTPUT_RULES:
+                return MULTI_OUTPUT_RULES[func_name](in_cols, kwargs)
+            rule = OUTPUT_RULES.get(func_name)
+            if rule is None or in_cols is None:
+                return None
+            out = rule(in_cols, kwargs)
+            return [str(c) for c in out] if out is not None else None
+        except Exception:
+            return None
+
+    # ------------------------------------------------------------------
+    def check(self, ops: list, schemas: dict):
+        """
+        Validate `ops` against `schemas` (name -> columns or None).
+        Returns (issues, inferred) where inferred maps each output name to its columns.
+        """
+        issues = []
+        env = dict(schemas)
+        for i, step in enumerate(ops):
+            if not isinstance(step, list) or len(step) != 4 or not isinstance(step[3], dict):
+                # the executor skips malformed steps, so they don't poison later ones
+                issues.append(PlanIssue(i, "bad_format", f"step is not [out, func, input, {{kwargs}}]: {step}",
+                                        fatal=False))
+                continue
+            output_name, func_name, input_name, kwargs = step
+
+            if func_name not in self.lib:
+                hint = difflib.get_close_matches(str(func_name), list(self.lib), n=1, cutoff=0.6)
+                issues.append(PlanIssue(i, "unknown_function", f"unknown function '{func_name}'",
+                                        hint[0] if hint else None))
+                env[output_name] = None
+                continue
+
+            names = input_name if isinstance(input_name, list) else [input_name]
+            missing = [n for n in names if n not in env]
+            for n in missing:
+                hint = difflib.get_close_matches(str(n), [str(k) for k in env], n=1, cutoff=0.6)
+                issues.append(PlanIssue(i, "unknown_input", f"input '{n}' is not defined before this step",
+                                        hint[0] if hint else None))
+            if missing:
+                env[output_name] = None
+                continue
+
+            is_multi = isinstance(input_name, list)
+            if is_multi != (func_name in MULTI_INPUT):
+                issues.append(PlanIssue(i, "bad_format",
+                                        f"{func_name}() expects {'a list of inputs' if func_name in MULTI_INPUT else 'a single input'}"))
+                env[output_name] = None
+                continue
+
+            in_cols = [env[n] for n in names] if is_multi else env[input_name]
+            self._check_args(i, func_name, kwargs, issues)
+            self._check_columns(i, func_name, kwargs, in_cols, issues)
+            env[output_name] = self._output(func_name, kwargs, in_cols)
+
+        inferred = {k: v for k, v in env.items() if k not in schemas}
+        return issues, inferred
+
+    # ------------------------------------------------------------------
+    def repair(self, ops: list, schemas: dict):
+        """
+        Apply every nearest-match suggestion that is unambiguous and re-check.
+        Returns (repaired_ops, remaining_issues).
+        """
+        fixed = [list(s) if isinstance(s, list) else s for s in ops]
+        # fix one step at a time: later schemas depend on earlier repairs
+        for _ in range(4 * len(fixed) + 1):
+            issues, _ = self.check(fixed, schemas)
+            fixable = [i for i in issues if i.suggestion]
+            if not fixable:
+                return fixed, issues
+            first = fixable[0].step
+            changed = False
+            for issue in (i for i in fixable if i.step == first):
+                step = fixed[issue.step]
+                if issue.kind == "unknown_function":
+                    step[1] = issue.suggestion
+                elif issue.kind == "unknown_input":
+                    bad = re.search(r"input '(.+?)'", issue.message).group(1)
+                    step[2] = ([issue.suggestion if n == bad else n for n in step[2]]
+                               if isinstance(step[2], list) else issue.suggestion)
+                elif issue.kind == "bad_argument" and "has no argument" in issue.message:
+                    bad = re.search(r"argument '(.+?)'", issue.message).group(1)
+                    kwargs = dict(step[3])
+                    if issue.suggestion in kwargs:
+                        continue
+                    kwargs[issue.suggestion] = kwargs.pop(bad)
+                    step[3] = kwargs
+                elif issue.kind == "unknown_column":
+                    bad = re.search(r"'(.+?)'", issue.message).group(1)
+                    step[3] = _replace_column(step[3], issue.arg, bad, issue.suggestion)
+                else:
+                    continue
+                print(f"🔧 Step {issue.step}: {issue.message} → '{issue.suggestion}'")
+                changed = True
+            if not changed:
+                return fixed, issues
+        return fixed, self.check(fixed, schemas)[0]
+
+
+def _replace_column(kwargs: dict, arg: str, bad: str, good: str) -> dict:
+    """Swap column `bad` for `good` in the column-name argument `arg` only."""
+    value = kwargs.get(arg)
+    if value == bad:
+        value = good
+    elif isinstance(value, (list, tuple)):
+        value = [good if v == bad else v for v in value]
+    elif isinstance(value, dict):
+        value = {good if k == bad else k: v for k, v in value.items()}
+    return {**kwargs, arg: value}
@@ -0,0 +1,106 @@
+# intelligence/analyzers/plan_schema.py
+"""
+JSON schema for Head-2 operation lists, passed to Ollama as `format` so the
+model can only emit well-formed plans.
+
+Built from the `function_lib` signatures (exact argument names, required
+arguments, scalar types from defaults) and the registered datasets: a step
+whose input is a registered dataset may only name that dataset's columns.
+Columns of intermediates depend on earlier steps and can't be enumerated up
+front, so steps that read an intermediate take free-form column strings and
+PlanChecker repairs near misses as before.
+"""
+
+import inspect
+
+from .plan_checker import COLUMN_ARGS, EXPR_ARGS, MULTI_INPUT, PlanChecker
+
+# column args that take exactly one column (the rest accept one or a list)
+SINGLE_COLUMN_ARGS = {"col", "year_col", "value_col", "group_col", "key_col", "target_col"}
+# output names are lowercase, so they can never shadow a dataset name (D1, D2, ...)
+OUTPUT_NAME = {"type": "string", "pattern": "^[a-z][a-z0-9_]*$"}
+FREE_COLUMN = {"type": "string"}
+ENUM_ARGS = {"how": ["inner", "left", "right", "outer"], "axis": [0, 1]}
+# int defaults that still take fractional values (z_thresh=2.5)
+NUMBER_ARGS = {"z_thresh"}
+
+
+def _arg_schema(func_name: str, name: str, param: inspect.Parameter, col: dict) -> dict:
+    if name == "mapping":
+        return {"type": "object", "additionalProperties": {"type": "string"}}
+    if name == "agg_map":
+        return {"type": "object", "additionalProperties": {
+            "anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]}}
+    if name in COLUMN_ARGS.get(func_name, ()):
+        if name in SINGLE_COLUMN_ARGS:
+            return col
+        return {"anyOf": [col, {"type": "array", "items": col, "minItems": 1}]}
+    if name in ("cols1", "cols2"):
+        return {"type": "array", "items": FREE_COLUMN, "minItems": 1}
+    if name in ENUM_ARGS:
+        return {"enum": ENUM_ARGS[name]}
+    if name in EXPR_ARGS.get(func_name, ()):
+        return {"type": "string"}
+    if name in NUMBER_ARGS:
+        return {"type": "number"}
+    default = param.default
+    if isinstance(default, bool):
+        return {"type": "boolean"}
+    if isinstance(default, int):
+        return {"type": "integer"}
+    if isinstance(default, float):
+        return {"type": "number"}
+    if isinstance(default, str):
+        return {"type": "string"}
+    return {"anyOf": [{"type": "string"}, {"type": "number"}]}
+
+
+def _step(func_name: str, input_schema: dict, kwargs_schema: dict) -> dict:
+    return {
+        "type": "array",
+        "prefixItems": [OUTPUT_NAME, {"const": func_name}, input_schema, kwargs_schema],
+        "minItems": 4,
+        "maxItems": 4,
+    }
+
+
+def plan_schema(datasets: dict, lib: dict | None = None, max_steps: int = 12) -> dict:
+    """
+    Schema for a JSON array of ["output", "function", "input", {kwargs}] steps.
+    `datasets` maps each registered name to its columns (PlanChecker.schemas_from).
+    """
+    lib = lib if lib is not None else PlanChecker().lib
+    named = {n: cols for n, cols in datasets.items() if cols}
+    defs = {f"cols_{n}": {"enum": cols} for n, cols in named.items()}
+    any_input = {"anyOf": [{"enum": list(datasets)}, OUTPUT_NAME]} if datasets else OUTPUT_NAME
+    unknown = [n for n in datasets if n not in named]
+    free_input = {"anyOf": [{"enum": unknown}, OUTPUT_NAME]} if unknown else OUTPUT_NAME
+
+    variants = []
+    for func_name in sorted(lib):
+        params = inspect.signature(lib[func_name]).parameters
+        skip = 2 if func_name in MULTI_INPUT and func_name != "concat_dfs" else 1
+        args = list(params.items())[skip:]
+
+        def kwargs_for(col):
+            return {
+                "type": "object",
+                "properties": {n: _arg_schema(func_name, n, p, col) for n, p in args},
+                "required": [n for n, p in args if p.default is p.empty],
+                "additionalProperties": False,
+            }
+
+        if func_name in MULTI_INPUT:
+            inputs = {"type": "array", "items": any_input, "minItems": 2}
+            if func_name != "concat_dfs":
+                inputs["maxItems"] = 2
+            variants.append(_step(func_name, inputs, kwargs_for(FREE_COLUMN)))
+            continue
+        for name in named:
+            variants.append(_step(func_name, {"const": name}, kwargs_for({"$ref": f"#/$defs/cols_{name}"})))
+        variants.append(_step(func_name, free_input, kwargs_for(FREE_COLUMN)))
+
+    schema = {"type": "array", "items": {"anyOf": variants}, "minItems": 1, "maxItems": max_steps}
+    if defs:
+        schema["$defs"] = defs
+    return schema
@@ -2,7 +2,10 @@ import json
 import pandas as pd
 import re
 from . import function_lib
+from .plan_checker import PlanChecker
 from ..agents.selfCritique import DatasetRegistry
+from ..runtime.profiler import frame_shape
+from contextlib import nullcontext
 import traceback, os
 
 # --- JSON helpers ---
@@ -45,6 +48,27 @@ def safe_json_loads(text: str):
         raise ValueError(f"JSON correction failed: {e}\nRaw text:\n{text}")
 
 
+# --- liveness helpers ---
+
+def step_inputs(step) -> list:
+    """Names a step reads (empty for malformed steps)."""
+    if not isinstance(step, list) or len(step) != 4:
+        return []
+    return list(step[2]) if isinstance(step[2], list) else [step[2]]
+
+
+def live_after(ops, i) -> set:
+    """Names still read by any step after index i."""
+    return {name for step in ops[i + 1:] for name in step_inputs(step)}
+
+
+def frame_bytes(val) -> int:
+    """Shallow in-memory size of a DataFrame (0 for scalars / other results)."""
+    if isinstance(val, pd.DataFrame):
+        return int(val.memory_usage(index=True, deep=False).sum())
+    return 0
+
+
 # --- Executor class ---
 
 class Analyser:
@@ -56,51 +80,68 @@ class Analyser:
             for name in dir(function_lib)
             if callable(getattr(function_lib, name)) and not name.startswith("_")
         }
+        self.checker = PlanChecker()
+        self.last_issues = []
+        self.last_ops = []
+        self.completed = False
+        self.skipped = 0
 
     def _env_from_registry(self, registry: DatasetRegistry):
         """Copy datasets into local env."""
         return dict(registry.datasets)
 
+    def _schemas_for_repair(self, env):
+        """Compact {name: {col: dtype}} view of every intermediate still in env."""
+        info = {}
+        for name, val in env.items():
+            if isinstance(val, pd.DataFrame):
+                info[name] = {str(c): str(t) for c, t in val.dtypes.items()}
+            else:
+                info[name] = type(val).__name__
+        return info
+
     def _repair_step(self, step, error, env):
+        """Ask the coder model to rewrite one failed step; returns the fixed step or None."""
         from ..agents.selfCritique import SelfCritiqueAgent
-        import re
         agent = SelfCritiqueAgent(coder_model="qwen2.5:14b", max_loops=2)
 
-        available_info = {name: list(df.columns) for name, df in env.items()}
+        available_info = self._schemas_for_repair(env)
 
         prompt = f"""
         You are an execution corrector.
         A function call failed during analysis.
 
         Failed step:
-        {json.dumps(step)}
+        {json.dumps(step, default=str)}
 
         Error:
-        {str(error)}
+        {type(error).__name__}: {str(error)[:500]}
 
-        Available datasets and their columns:
-        {json.dumps(available_info, indent=2)}
+        Available datasets and their columns (name -> column -> dtype):
+        {json.dumps(available_info, separators=(",", ":"))}
 
         Please rewrite ONLY this step so that it is executable,
         using valid column names and dataset references from the above list.
+        Keep the same output name and function signature.
         Output a single corrected JSON list in the same 4-element format.
         """
 
         resp = agent._chat(prompt=prompt).strip()
 
         # --- 🧹 extract the JSON block first ---
-        match = re.search(r"```json(.*?)```", resp, flags=re.S)
-        if not match:
-            match = re.search(r"\[(.*?)\]", resp, flags=re.S)
-            if match:
-                resp = "[" + match.group(1) + "]"
-        else:
+        match = re.search(r"```(?:json)?(.*?)```", resp, flags=re.S)
+        if match:
             resp = match.group(1).strip()
+        elif "[" in resp and "]" in resp:
+            resp = resp[resp.index("["): resp.rindex("]") + 1]
 
         # --- now parse safely ---
         try:
             fixed = safe_json_loads(resp)
-            if isinstance(fixed, list) and len(fixed) == 4:
+            if isinstance(fixed, list) and len(fixed) == 1 and isinstance(fixed[0], list):
+                fixed = fixed[0]
+            if isinstance(fixed, list) and len(fixed) == 4 and isinstance(fixed[3], dict):
+                fixed[0] = step[0]  # later steps refer to this name
                 print(f"🔧 Corrected step: {fixed}")
                 return fixed
             else:
@@ -132,8 +173,41 @@ class Analyser:
             return func(df, **kwargs)
 
 
-    def run_function_sequence(self, seq: str, registry: DatasetRegistry):
-        """Main loop — executes or repairs each step."""
+    def _release_dead(self, ops, i, final_name, pinned, env, results, registry, sources):
+        """
+        Drop intermediates no later step reads. Registry sources are never
+        dropped: a step output that shadowed one (repairs and library plans
+        may reuse a name like "D1") is released by restoring the original frame.
+        """
+        live = live_after(ops, i) | set(pinned) | {final_name}
+        for name in [n for n in results if n not in live]:
+            results.pop(name, None)
+            if name in sources:
+                env[name] = sources[name]
+                registry.datasets[name] = sources[name]
+            else:
+                env.pop(name, None)
+                registry.datasets.pop(name, None)
+            self.released.append(name)
+
+    def run_function_sequence(self, seq: str, registry: DatasetRegistry,
+                              repair: bool = False, max_repairs: int = 2,
+                              pin=(), profiler=None):
+        """
+        Main loop — executes or repairs each step.
+
+        With repair=True a failing step is sent back to the coder model on its
+        own (plus the schemas of everything computed so far) and execution
+        resumes from that step; earlier results are kept, never recomputed.
+        At most `max_repairs` LLM corrections are spent per run.
+
+        Intermediates are released as soon as no later step reads them, unless
+        they are the final step's output or listed in `pin`, so peak memory
+        tracks the largest working set rather than the sum of all steps.
+
+        If a `profiler` is given, each step is recorded as a "step" span with
+        rows/cols in and out and the number of defensive copies it made.
+        """
         try:
             ops = normalize_ops(safe_json_loads(seq))
         except Exception as e:
@@ -141,25 +215,79 @@ class Analyser:
             return results
 
         env = self._env_from_registry(registry)
+        sources = dict(registry.datasets)     # the datasets Head-3 reads; never released
+
+        # --- static pass: repair typos, reject plans that can't run ---
+        ops, issues = self.checker.repair(ops, PlanChecker.schemas_from(env))
+        self.last_issues = issues
+        # the ops as actually executed (static and runtime repairs included)
+        self.last_ops = ops
+        self.completed = False
+        self.skipped = 0
+        fatal = [i for i in issues if i.fatal]
+        if fatal:
+            for issue in fatal:
+                print(f"❌ Step {issue.step}: {issue.message}")
+            if not repair:
+                print("Plan rejected before execution.")
+                return registry.datasets
+
+        # statically broken steps go straight to repair instead of running
+        pending = {issue.step: issue for issue in fatal}
         results = {}
         last_result = None
-
-        for step in ops:
+        self.repairs_used = 0
+        self.released = []
+        base_bytes = sum(frame_bytes(df) for df in env.values())
+        self.peak_bytes = base_bytes
+        final_name = next((s[0] for s in reversed(ops) if isinstance(s, list) and len(s) == 4), None)
+        i = 0
+
+        while i < len(ops):
+            step = ops[i]
             if not isinstance(step, list) or len(step) != 4:
                 print(f"Bad step format, skipping: {step}")
+                self.skipped += 1
+                i += 1
                 continue
 
             output_name, func_name, input_name, kwargs = step
             func = self.lib.get(func_name)
             if not func:
                 print(f"Unknown function: {func_name}")
+                self.skipped += 1
+                i += 1
                 continue
 
             try:
-                result = self._execute_step(func, func_name, input_name, kwargs, env, results)
+                if i in pending:
+                    raise ValueError(pending.pop(i).message)
+                copies0 = function_lib._copies_made()
+                span = (profiler.span(output_name, kind="step", per_thread=True, func=func_name, index=i)
+                        if profiler else nullcontext({}))
+                with span as rec:
+                    rec["shape_in"] = [frame_shape(env.get(n)) for n in step_inputs(step)]
+                    result = self._execute_step(func, func_name, input_name, kwargs, env, results)
+                    rec["shape_out"] = frame_shape(result)
+                    rec["bytes_out"] = frame_bytes(result)
+                    rec["copies"] = function_lib._copies_made() - copies0
                 print(f"Running {func_name} on '{input_name}' → '{output_name}'")
             except Exception as e:
                 print(f"Error at step: {step}")
+                if repair and self.repairs_used < max_repairs:
+                    self.repairs_used += 1
+                    print(f"Repairing step {i} ({self.repairs_used}/{max_repairs}).")
+                    try:
+                        fixed = self._repair_step(step, e, env)
+                        if fixed is not None:
+                            fixed = normalize_ops([fixed])[0]
+                    except Exception as repair_error:
+                        # LLM unreachable or unusable reply: keep what already ran
+                        print(f"⚠️ Repair failed: {type(repair_error).__name__}: {repair_error}")
+                        fixed = None
+                    if fixed is not None:
+                        ops[i] = fixed
+                        continue  # retry this step; earlier results stay in env
                 print("Repairing early.")
                 print("✅ Partial execution successfully.")
                 #check if results is empty if its empty return registry datasets
@@ -173,7 +301,14 @@ class Analyser:
             if isinstance(result, pd.DataFrame):
                 registry.datasets[output_name] = result
             last_result = result
+            self.peak_bytes = max(self.peak_bytes,
+                                  base_bytes + sum(frame_bytes(v) for v in results.values()))
+            self._release_dead(ops, i, final_name, pin, env, results, registry, sources)
+            i += 1
 
         print("✅ Sequence executed successfully.")
+        self.completed = True
+        if self.released:
+            print(f"🧹 Released {len(self.released)} intermediates; peak ≈ {self.peak_bytes / 1e6:.1f} MB")
         results["_FINAL_"] = last_result
         return results
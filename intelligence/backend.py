@@ -3,13 +3,26 @@ from .agents.head1_planner import Head1Planner
 from .llm_tools.dataframeFetcher import DataframeFetcher
 from .agents.selfCritique import DatasetRegistry
 from .analyzers.runAnaysis import Analyser
+from .analyzers.plan_checker import PlanChecker
+from .analyzers.plan_schema import plan_schema
 from .agents.head3_summarizer import Head3Answerer
-from .llm_tools.ollama_utils import OllamaManager
-import ollama
+from .llm_tools.ollama_utils import OllamaManager, residency
+from .llm_tools.embeddings import embedding_models, embedding_service
+from .runtime.profiler import PROFILE_ALLOC, Profiler
+from .runtime.prefetch import Prefetcher
+from .runtime.answer_cache import AnswerCache, selection_versions
+from .runtime.plan_library import PlanLibrary, schema_fingerprint
+from .query_parser import to_template
+from .runtime.batch import BatchRunner
+from .llm_tools.local_llm import LocalLLM, track_usage
+from .runtime.scheduler import RequestGate, iterate_in_thread, run_cpu
 from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import json
+import os
+import threading
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -18,46 +31,68 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+HEAD2_PROMPT = """
+        You are an analysis planner.
+        Use only the following functions:
+
+        {tools_doc}
+
+        Input datasets:
+        {datasets}
+
+        Assume all datasets end in the year 2022.
+        If you need to refer to 'current year', use 2018 instead of datetime.now() or max(YEAR).
+
+        Plan:
+        {plan}
+
+        Output a JSON array of operations.
+        Each operation must strictly follow this format:
+        ["output_name", "function_name", "input_name", {{"arg1": value1, "arg2": value2}}]
+
+        Rules:
+        - "output_name" is a short lowercase label for storing this step’s result (e.g., "filtered", "year_avg", "joined").
+        - "input_name" can refer to a dataset name or a previously defined output_name.
+        - Use only dataset or output names that exist earlier in the sequence.
+        - Do not add explanations or comments — only pure JSON array output.
+        """
+
+
+def send(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class EventLog(list):
+    """send() that also remembers every event of the run (for the answer cache)."""
+
+    def send(self, event_type, data):
+        self.append((event_type, data))
+        return send(event_type, data)
+
+
 class Intellegence:
+    """
+    Runs the pipeline for one query. Nothing request-specific lives on the
+    instance: the orchestrator, registry, profiler and analyser are created
+    per call, so several requests can share one Intellegence.
+    """
 
     def __init__(self):
-        pass
+        with open("intelligence/analyzers/function_docs.txt") as f:
+            self.tools_doc = f.read()
 
-    def get_response(self,query):
-        
-        def send(event_type, data):
-            return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
-        
-        yield send("status", {"stage": "init", "message": "Starting analysis..."})
-        yield send("next", {"stage": "family", "message": "Selecting dataset family..."})
-        orch = AnalysisOrchestrator(sector_index_path="dataHandlers/data/sectors/sector_index.json",selector_model="mistral-nemo:12b")
-    
-        planner = Head1Planner()
-        
-        res = orch.select_family(query)
-        yield send("family", res)
-        # to be returned
-        return_selected_family = res
-        return_selected_datasets = None
-        return_registry = None
-        return_head1_plan = None
-        return_head2_plan = None
-        return_head3_plan = None
-        if res["selected_datasets"] == [-1]:
-            yield send("done", {"error": "No datasets found"})
-            return
-        
-        yield send("next", {"stage": "datasets", "message": "Selecting datasets..."})    
-        files_res = orch.select_files(query, res["selected_datasets"])
-        print(files_res)
-        yield send("datasets", files_res)
-        yield send("next", {"stage": "registry", "message": "Fetching and registering DataFrames..."})
-        # to be retuned
-        return_selected_datasets = files_res
+    # ---- blocking stages (run on the pandas pool) ----
+    def orchestrator(self):
+        return AnalysisOrchestrator(sector_index_path="dataHandlers/data/sectors/sector_index.json",selector_model="mistral-nemo:12b")
 
+    def embed_query(self, query):
+        # same MiniLM vector the family selector uses (cached by the service)
+        return embedding_service().encode("minilm", [query])[0]
+
+    def load_registry(self, files_res, prefetcher=None):
         fetcher = DataframeFetcher()
         
-        dfs = fetcher.fetch_selected_files(files_res)
+        dfs = fetcher.fetch_selected_files(files_res, prefetcher=prefetcher)
         
         registry = DatasetRegistry()
         
@@ -65,114 +100,215 @@ class Intellegence:
         
             name = f"D{i}"
         
-            registry.register(name=name,df=df)
-        
+            registry.register(name=name,df=df,prepared=bool(prefetcher and prefetcher.is_prepared(df)))
+
         preview_data = {}
         for name, df in registry.datasets.items():
             try:
                 preview_data[name] = df.head(5).to_dict(orient="records")
             except Exception:
                 preview_data[name] = "Preview unavailable"
+        return registry, preview_data
 
-        yield send("registry", {"previews": preview_data})
-        yield send("next", {"stage": "head1", "message": "Generating high-level analytical plan..."})
-        plan = planner.plan(query=query, registry=registry)
-        
-        # registry
-        return_registry = registry
-        # return head 1's plan
-        return_head1_plan = plan
-        yield send("head1", {"plan": plan})
-        yield send("next", {"stage": "head2", "message": "Converting plan to executable steps..."})
-        # saveFiles(registry=registry,plan=plan)
-        # registry, plan, _ = loadFiles()
+    def head2_prompt(self, registry, plan):
+        return HEAD2_PROMPT.format(tools_doc=self.tools_doc, datasets=registry.describe_compact(), plan=plan)
 
-        with open("intelligence/analyzers/function_docs.txt") as f:
-            tools_doc = f.read()
-        # OllamaManager.stop_model("mistral-nemo:12b")
-        prompt = f"""
-        You are an analysis planner.
-        Use only the following functions:
+    def head2_schema(self, registry):
+        # constrains Head-2 to real functions, argument names and dataset columns
+        return plan_schema(PlanChecker.schemas_from(registry.datasets))
 
-        {tools_doc}
+    # ---- async pipeline ----
+    async def get_response(self, query, gated=False):
+        usage = track_usage()
+        prof = Profiler(track_alloc=PROFILE_ALLOC)
+        log = EventLog()
+        # reserved here, not in the endpoint: an un-started generator never runs
+        # its finally, so a client gone before the first chunk would leak the slot
+        ticket = gate.try_enqueue() if gated else None
+        if gated and ticket is None:
+            # backpressure, sent in-stream: EventSource can't read the body of a 429
+            prof.close()
+            yield send("busy", {"message": "Server busy, try again shortly.", "retry_after": 30, **gate.status()})
+            yield send("done", {"error": "Server busy, try again shortly."})
+            return
 
-        Input datasets:
-        {registry.describe_all()}
+        try:
+            if ticket is not None:
+                async for pos in gate.wait(ticket):
+                    yield log.send("queue", {"position": pos, **gate.status()})
 
-        Assume all datasets end in the year 2022.
-        If you need to refer to 'current year', use 2018 instead of datetime.now() or max(YEAR).
+            orch = await run_cpu(self.orchestrator)
+            with prof.span("answer_cache") as rec:
+                qvec = await run_cpu(self.embed_query, query)
+                hit, similarity = await run_cpu(answers.lookup, query, qvec)
+                rec.update(hit=hit is not None, similarity=similarity)
+            if hit:
+                # near-duplicate of a finished run on unchanged data: replay it
+                yield send("cache", {"hit": True, "similarity": similarity, "cached_query": hit["query"],
+                                     **answers.status()})
+                for event_type, data in hit["events"]:
+                    yield send(event_type, data)
+                await run_cpu(prof.write)
+                return
+            yield log.send("cache", {"hit": False, "similarity": similarity})
 
-        Plan:
-        {plan}
+            yield log.send("status", {"stage": "init", "message": "Starting analysis..."})
+            yield log.send("next", {"stage": "family", "message": "Selecting dataset family..."})
+            with prof.span("family") as rec:
+                res = await run_cpu(orch.select_family, query)
+            yield log.send("profile", rec)
+            yield log.send("family", res)
+            if res["selected_datasets"] == [-1]:
+                await run_cpu(prof.write)
+                yield log.send("done", {"error": "No datasets found"})
+                return
+            
+            yield log.send("next", {"stage": "datasets", "message": "Selecting datasets..."})    
+            # retrieval candidates start loading while the re-rank LLM is still deciding
+            prefetcher = Prefetcher()
+            with prof.span("datasets") as rec:
+                files_res = await run_cpu(orch.select_files, query, res["selected_datasets"], prefetcher)
+            print(files_res)
+            yield log.send("profile", rec)
+            yield log.send("datasets", files_res)
+            yield log.send("next", {"stage": "registry", "message": "Fetching and registering DataFrames..."})
 
-        Output a JSON array of operations.
-        Each operation must strictly follow this format:
-        ["output_name", "function_name", "input_name", {{"arg1": value1, "arg2": value2}}]
+            with prof.span("registry") as rec:
+                try:
+                    registry, preview_data = await run_cpu(self.load_registry, files_res, prefetcher)
+                finally:
+                    rec["prefetch"] = prefetcher.finish()
+                rec["shapes"] = {n: list(d.shape) for n, d in registry.datasets.items()}
+            yield log.send("profile", rec)
 
-        Rules:
-        - "output_name" is a short label for storing this step’s result (e.g., "filtered", "year_avg", "joined").
-        - "input_name" can refer to a dataset name or a previously defined output_name.
-        - Use only dataset or output names that exist earlier in the sequence.
-        - Do not add explanations or comments — only pure JSON array output.
-        """
+            yield log.send("registry", {"previews": preview_data})
+            # a validated plan for the same question shape and schemas skips Head-1 and Head-2
+            fingerprint = schema_fingerprint(registry.datasets)
+            tvec = await run_cpu(self.embed_query, to_template(query)[0])
+            reuse = await run_cpu(plans.lookup, query, tvec, fingerprint)
+            if reuse:
+                plan, ops, reuse_info = reuse
+                resp = json.dumps(ops)
+                yield log.send("library", reuse_info)
+                yield log.send("next", {"stage": "head1", "message": "Reusing a validated plan..."})
+                yield log.send("head1", {"plan": plan, "from_library": True})
+                yield log.send("next", {"stage": "head2", "message": "Re-binding stored steps..."})
+                yield log.send("head2", {"operations": resp, "from_library": True})
+            else:
+                yield log.send("next", {"stage": "head1", "message": "Generating high-level analytical plan..."})
+                planner = Head1Planner()
+                with prof.span("head1") as rec:
+                    plan = ""
+                    async for delta in iterate_in_thread(lambda: planner.plan_stream(query=query, registry=registry)):
+                        plan += delta
+                        yield log.send("head1_delta", {"delta": delta})
+                    plan = plan.strip()
+                    rec["schema_tokens"] = registry.schema_report
+                yield log.send("profile", rec)
+                yield log.send("head1", {"plan": plan})
+                yield log.send("next", {"stage": "head2", "message": "Converting plan to executable steps..."})
 
-        # === Step 3: Convert plan → executable sequence ===
-        response = ollama.chat(model="qwen2.5:14b", messages=[{"role": "user", "content": prompt}]) # 3min 30sec
-        resp = response.get("message", {}).get("content", "").strip()
-        
-        return_head2_plan = resp
-        yield send("head2", {"operations": resp})
-        yield send("next", {"stage": "head3", "message": "Summarizing and synthesizing final answer..."})
-        # saveFiles(registry=registry, plan=plan, res=resp)
-
-        analyst = Analyser()
-        result = analyst.run_function_sequence(seq=resp, registry=registry)
-        summarizer = Head3Answerer()
-        results = summarizer.summarize_results(registry=registry,results=result,query=query)
-        
-        if results:
-            pass
-        else:
-            results = "No results to summarize."
+                # === Step 3: Convert plan → executable sequence ===
+                prompt = await run_cpu(self.head2_prompt, registry, plan)
+                schema = self.head2_schema(registry)
+                with prof.span("head2") as rec:
+                    resp = ""
+                    async for delta in iterate_in_thread(
+                            lambda: LocalLLM(model="qwen2.5:14b").stream(prompt, format=schema)): # 3min 30sec
+                        resp += delta
+                        yield log.send("head2_delta", {"delta": delta})
+                    resp = resp.strip()
+                    rec["schema_tokens"] = registry.schema_report
+                yield log.send("profile", rec)
+                yield log.send("head2", {"operations": resp})
+            yield log.send("next", {"stage": "head3", "message": "Summarizing and synthesizing final answer..."})
 
-        return_head3_plan = results
-        yield send("head3", {"summary": results})
-        yield send("done", {"message": "Analysis complete"})
-        yield send("next", {"stage": "done", "message": "Finalizing and cleaning up models..."})
+            analyst = Analyser()
+            n_before = len(prof.records)
+            with prof.span("analysis") as rec:
+                result = await run_cpu(analyst.run_function_sequence, seq=resp, registry=registry,
+                                       repair=True, profiler=prof)
+            for step_rec in prof.records[n_before:]:
+                yield log.send("profile", step_rec)
+            if reuse and not analyst.completed:
+                plans.drop(reuse_info["id"])
+            elif not reuse and analyst.completed and not analyst.skipped:
+                await run_cpu(plans.store, query, tvec, fingerprint, plan, analyst.last_ops)
+            summarizer = Head3Answerer()
+            with prof.span("head3") as rec:
+                results = ""
+                async for delta in iterate_in_thread(
+                        lambda: summarizer.summarize_stream(registry=registry,results=result,query=query)):
+                    results += delta
+                    yield log.send("head3_delta", {"delta": delta})
+                results = results.strip()
+            yield log.send("profile", rec)
+            
+            if results:
+                pass
+            else:
+                results = "No results to summarize."
 
-        OllamaManager.stop_model("qwen2.5:14b")
+            await run_cpu(prof.write)
+            yield log.send("profile", {"kind": "summary", **prof.summary(), "llm_calls": usage,
+                                   "model_swaps": sum(1 for c in usage if c.get("swap")),
+                                   "residency": residency().status(), "answer_cache": answers.status(),
+                                   "plan_library": plans.status()})
+            yield log.send("head3", {"summary": results})
+            yield log.send("done", {"message": "Analysis complete"})
+            yield log.send("next", {"stage": "done", "message": "Finalizing and cleaning up models..."})
+            if results != "No results to summarize.":
+                await run_cpu(answers.store, query, qvec, selection_versions(files_res), log)
+            # models stay resident under keep_alive; residency() evicts when the RAM budget needs it
+        finally:
+            prof.close()
+            if ticket is not None:
+                await gate.release(ticket)
 
 intel = Intellegence()
-@app.get("/query")
-def query_endpoint(query: str):
-    return StreamingResponse(intel.get_response(query), media_type="text/event-stream")
-
+gate = RequestGate()
+answers = AnswerCache()
+plans = PlanLibrary()
+batch = BatchRunner(intel)
 
-# if __name__ == '__main__':
-#     intellegent = Intellegence()
-    # queries = [
-    #     # 1️⃣ Climate–Agriculture comparison
-    #     "Compare the average annual rainfall in Tamil Nadu and Kerala for the last 5 available years. In parallel, list the top 5 most produced food crops by volume in each of those states during the same period, with source citations from IMD and the Department of Agriculture.",
+# models in the order one request first needs them
+PRELOAD_MODELS = [m for m in os.getenv("PRELOAD_MODELS", "mistral-nemo:12b,qwen2.5:14b").split(",") if m]
+# embedding models to pin before the first request ("" = load lazily)
+PRELOAD_EMBEDDINGS = [m for m in os.getenv("PRELOAD_EMBEDDINGS", "minilm,bge,rerank").split(",") if m]
 
-    #     # 2️⃣ Crop variety lookup
-    #     "List all crop varieties released for Wheat under the 'Crop Development & Seed Production' sector, including the year of release and certifying institute.",
+@app.on_event("startup")
+def preload_models():
+    # loading takes minutes on CPU; don't block the server from accepting requests
+    threading.Thread(target=residency().preload, args=(PRELOAD_MODELS,), daemon=True).start()
+    threading.Thread(target=embedding_models().warmup, args=(PRELOAD_EMBEDDINGS,), daemon=True).start()
 
-    #     # 3️⃣ District-level production comparison (if available)
-    #     "Identify the district in Maharashtra with the highest sugarcane production in the most recent year available and compare it with the district in Karnataka that recorded the lowest sugarcane production for the same period.",
+@app.get("/query")
+async def query_endpoint(query: str):
+    # a full queue is reported as a "busy" event inside the stream
+    return StreamingResponse(intel.get_response(query, gated=True), media_type="text/event-stream")
 
-    #     # 4️⃣ Scheme beneficiary stats
-    #     "Report the number of beneficiaries registered under the PM-KISAN scheme in Nicobar district for the financial year 2022–23.",
+@app.get("/status")
+def status_endpoint():
+    return {"requests": gate.status(), "models": residency().status(), "answers": answers.status(),
+            "plans": plans.status(), "embeddings": embedding_service().status()}
 
-    #     # 5️⃣ Trend + correlation (multi-dataset)
-    #     "Analyze the production trend of Rice in Eastern Uttar Pradesh over the last decade. Correlate this trend with annual rainfall data from IMD for the same region and summarize the apparent impact.",
 
-    #     # 6️⃣ Policy analysis query
-    #     "Evaluate a policy proposal to promote Millets (drought-resistant) over Paddy (water-intensive) in Telangana. Using the last 10 years of agricultural and climate data, provide three strong data-backed arguments supporting this policy, citing all sources."
-    # ]
+class BatchRequest(BaseModel):
+    queries: list[str]
 
+@app.post("/batch")
+def batch_endpoint(req: BatchRequest):
+    # runs stage by stage in a background thread; poll /batch/{id} for progress.
+    # the report path is fixed server-side (cache/batch/<id>.parquet)
+    job = batch.submit(req.queries)
+    if job is None:
+        return JSONResponse({"error": "A batch job is already running, try again later."},
+                            status_code=429, headers={"Retry-After": "60"})
+    return job
 
-#     for query in queries:
-#         print()
-#         print("Query -> ",query)
-#         head1_plan , head2_plan ,head3_plan , registry , selected_datasets , selected_family = intellegent.get_response(query=query)
-#         print(head3_plan)
+@app.get("/batch/{job_id}")
+def batch_status(job_id: str):
+    job = batch.jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown batch job"}, status_code=404)
+    return job
@@ -0,0 +1,204 @@
+# intelligence/llm_tools/ann_index.py
+"""
+Catalog-wide approximate nearest-neighbour index (IVF) over the embedding
+store, with family filters.
+
+Every dataset vector in EmbeddingStore is assigned to its nearest of
+`nlist` (~sqrt(N)) spherical k-means centroids. A search scores the
+centroids, then only the rows in the `nprobe` best lists; with N = 100k
+that is a few thousand float16 rows instead of all of them. Pure NumPy, so
+nothing beyond what the repo already installs.
+
+Filters: each row carries the families it was added under. A filtered
+search whose family is small (<= ANN_EXACT_LIMIT rows) is answered exactly
+over that family; otherwise the probe widens until k filtered hits are found.
+
+Inserts are incremental: rows the index hasn't seen (and rows the store
+re-encoded in place) are assigned to their nearest centroid; the
+centroids are retrained once the catalog has grown ANN_RETRAIN_GROWTH
+times since the last training. State lives in
+intelligence/embedding_cache/ann/<tag>/ next to the store.
+
+    python -m intelligence.llm_tools.ann_index     # index every sector file
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from .embedding_store import EmbeddingStore, embedding_store
+
+ANN_DIR = "intelligence/embedding_cache/ann"
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_EXACT_LIMIT = int(os.getenv("ANN_EXACT_LIMIT", "4096"))
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "4"))
+
+
+def spherical_kmeans(x: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Unit-norm centroids maximising cosine similarity to their members."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = ~sums.any(axis=1)
+        # re-seed empty clusters from random points
+        sums[empty] = x[rng.choice(len(x), size=int(empty.sum()))]
+        centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(1e-12)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    def __init__(self, store: EmbeddingStore, root: str = ANN_DIR, nprobe: int = ANN_NPROBE):
+        self.store = store
+        self.dir = os.path.join(root, store.tag)
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        self.centroids = None
+        self.assign = np.zeros(0, dtype=np.int32)      # row -> list (-1 = not indexed)
+        self.trained_on = 0
+        self.families = {}                              # family -> sorted rows
+        self._updates_seen = 0
+        self._lists = None
+        self._load()
+
+    # ---- persistence ----
+    def _load(self):
+        try:
+            arrays = np.load(os.path.join(self.dir, "ivf.npz"))
+            with open(os.path.join(self.dir, "families.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.centroids = arrays["centroids"] if arrays["centroids"].size else None
+        self.assign = arrays["assign"]
+        self.trained_on = meta["trained_on"]
+        self.families = {f: np.asarray(rows, dtype=np.int64) for f, rows in meta["families"].items()}
+
+    def _save(self):
+        tmp = os.path.join(self.dir, f"ivf.{os.getpid()}.tmp.npz")
+        np.savez(tmp, centroids=self.centroids if self.centroids is not None else np.zeros((0, 0), np.float32),
+                 assign=self.assign)
+        os.replace(tmp, os.path.join(self.dir, "ivf.npz"))
+        tmp = os.path.join(self.dir, f"families.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"trained_on": self.trained_on,
+                       "families": {k: v.tolist() for k, v in self.families.items()}}, f)
+        os.replace(tmp, os.path.join(self.dir, "families.json"))
+
+    # ---- building ----
+    def _vectors(self, rows) -> np.ndarray:
+        return np.asarray(self.store.vecs[rows], dtype=np.float32)
+
+    def _train(self):
+        n = self.store.manifest["rows"]
+        nlist = max(1, int(np.sqrt(n)))
+        sample = np.random.default_rng(0).choice(n, size=min(n, 50 * nlist), replace=False)
+        self.centroids = spherical_kmeans(self._vectors(np.sort(sample)), nlist)
+        self.assign = np.full(n, -1, dtype=np.int32)
+        self.trained_on = n
+        self._assign(np.arange(n))
+        print(f"🧭 ANN index ({self.store.model}): trained {nlist} lists over {n} rows")
+
+    def _assign(self, rows: np.ndarray, chunk: int = 8192):
+        for i in range(0, len(rows), chunk):
+            part = rows[i:i + chunk]
+            self.assign[part] = np.argmax(self._vectors(part) @ self.centroids.T, axis=1)
+        self._lists = None
+
+    def add(self, rows: np.ndarray, family: str):
+        """Index `rows` (store row numbers) under `family`; cheap when nothing is new."""
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        with self._lock:
+            changed = False
+            known = self.families.get(family, np.zeros(0, dtype=np.int64))
+            if len(rows) != len(known) or not np.array_equal(rows, known):
+                self.families[family] = rows
+                changed = True
+
+            n = self.store.manifest["rows"]
+            if n and (self.centroids is None or n >= ANN_RETRAIN_GROWTH * self.trained_on):
+                self._train()
+                self._updates_seen = len(self.store.updated)
+                changed = True
+            elif n > len(self.assign):
+                old = len(self.assign)
+                self.assign = np.concatenate([self.assign, np.full(n - old, -1, dtype=np.int32)])
+                self._assign(np.arange(old, n))
+                changed = True
+            if len(self.store.updated) > self._updates_seen and self.centroids is not None:
+                # vectors re-encoded in place may belong to another list now
+                self._assign(np.unique(np.asarray(self.store.updated[self._updates_seen:])))
+                self._updates_seen = len(self.store.updated)
+                changed = True
+            if changed:
+                self._save()
+
+    # ---- search ----
+    def _inverted(self):
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def search(self, qvec: np.ndarray, k: int = 50, family: str | None = None):
+        """Top-k (rows, cosine scores), optionally only rows of `family`."""
+        qvec = np.asarray(qvec, dtype=np.float32)
+        with self._lock:
+            allowed = self.families.get(family) if family is not None else None
+            if family is not None and allowed is None:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            if self.centroids is None or (allowed is not None and len(allowed) <= ANN_EXACT_LIMIT):
+                rows = allowed if allowed is not None else np.arange(self.store.manifest["rows"])
+                scores = self._vectors(rows) @ qvec
+            else:
+                order, bounds = self._inverted()
+                ranked = np.argsort(-(self.centroids @ qvec))
+                nprobe = self.nprobe
+                while True:
+                    lists = ranked[:nprobe]
+                    rows = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in lists])
+                    if allowed is not None:
+                        rows = rows[np.isin(rows, allowed, assume_unique=True)]
+                    if len(rows) >= k or nprobe >= len(ranked):
+                        break
+                    nprobe *= 2
+                rows = np.sort(rows)
+                scores = self._vectors(rows) @ qvec
+        top = np.argsort(-scores)[:k]
+        return rows[top], scores[top]
+
+    def status(self) -> dict:
+        return {"lists": 0 if self.centroids is None else len(self.centroids),
+                "indexed": int((self.assign >= 0).sum()), "trained_on": self.trained_on,
+                "families": {f: len(r) for f, r in self.families.items()}, "nprobe": self.nprobe}
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def catalog_index(model: str = "bge") -> IVFIndex:
+    """Process-wide ANN index over embedding_store(model)."""
+    with _indexes_lock:
+        if model not in _indexes:
+            _indexes[model] = IVFIndex(embedding_store(model))
+        return _indexes[model]
+
+
+if __name__ == "__main__":
+    from .file_selector import FileSearchTool
+
+    with open("dataHandlers/data/sectors/sector_index.json", encoding="utf-8") as f:
+        sectors = json.load(f)
+    for family, path in sectors.items():
+        data = json.load(open(path))
+        if "states" in data:        # PM-KISAN has its own key index
+            continue
+        FileSearchTool(data)        # syncs the store and adds the family
+    print(json.dumps(catalog_index().status(), indent=2))
@@ -14,9 +14,10 @@ class DataframeFetcher:
     def __init__(self):
         pass
 
-    def fetch_selected_files(self,selected_files_dict):
+    def fetch_selected_files(self,selected_files_dict,prefetcher=None):
         """
         Takes the exact structure printed by your Stage-2 output.
+        Files already loaded by `prefetcher` are taken from it instead of re-read.
         Returns: dict[file_title -> DataFrame]
         """
         fetcher = DataFetcher()
@@ -30,7 +31,9 @@ class DataframeFetcher:
                         continue
                     
                     try:
-                        df = fetcher.load_any(family_name,entry)
+                        df = prefetcher.take(family_name,entry) if prefetcher else None
+                        if df is None:
+                            df = fetcher.load_any(family_name,entry)
                         title = entry.get("title") or entry.get("id") or str(entry)
                         results[title] = df
                     except Exception as e:
@@ -1,11 +1,8 @@
 # intelligence/llm_tools/dataset_search_tool.py
 import json
-import re
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from .local_llm import LocalLLM
-import os
-import ollama
+from .embeddings import embedder
+from .local_llm import LocalLLM, choice_schema
 
 class DatasetSearchTool:
     """
@@ -17,7 +14,7 @@ class DatasetSearchTool:
     def __init__(self, dataset_map: dict, model: str = "mistral-nemo:12b"):
         self.dataset_map = dataset_map
         self.model = model
-        # self.llm = LocalLLM(model=model)
+        self.llm = LocalLLM(model=model)
         self.dataset_ids = {i + 1: name for i, name in enumerate(dataset_map.keys())}
 
         # ---- Aliases for rule-based and embedding cues ----
@@ -29,28 +26,8 @@ class DatasetSearchTool:
             "Temperature and Rainfall": ["rainfall", "temperature", "climate", "weather"],
         }
 
-        # ---- SentenceTransformer (CPU-only, pre-loaded once) ----
-        try:
-            model_path = "./models/all-MiniLM-L6-v2"
-            if not os.path.exists(model_path):
-                raise FileNotFoundError
-
-            self.sentence_model = SentenceTransformer(
-                model_path,
-                device="cpu",
-                local_files_only=True
-            )
-        except Exception:
-            print("⚠️ Local embedding model not found. Downloading...")
-            self.sentence_model = SentenceTransformer("all-MiniLM-L6-v2" , device="cpu")
-            os.makedirs("./models", exist_ok=True)
-            self.sentence_model.save(model_path)
-            self.sentence_model = SentenceTransformer(
-                model_path,
-                device="cpu",
-                local_files_only=True
-            )
-            print("✅ Model cached locally.")
+        # ---- MiniLM via the shared embedding service ----
+        self.embedder = embedder("minilm")
 
         dataset_texts = [
             "Beneficiaries (PM-KISAN): farmers, government benefits, instalments, village-wise data",
@@ -60,11 +37,11 @@ class DatasetSearchTool:
             "Temperature and Rainfall: climate, rainfall, weather, temperature",
         ]
         self.dataset_texts = dataset_texts
-        self.dataset_vecs = self.sentence_model.encode(dataset_texts, normalize_embeddings=True)
+        self.dataset_vecs = self.embedder.encode(dataset_texts)
 
     # ---- Semantic retriever first ----
     def retrieve_relevant_families(self, query, top_k=2, threshold=0.45):
-        qvec = self.sentence_model.encode([query], normalize_embeddings=True)[0]
+        qvec = self.embedder.encode_one(query)
         sims = np.dot(self.dataset_vecs, qvec)
         top_indices = np.argsort(-sims)[:top_k]
         best, second = sims[top_indices[0]], sims[top_indices[1]]
@@ -117,8 +94,7 @@ class DatasetSearchTool:
         Your job is classification, not answering the question.
 
         INSTRUCTIONS:
-        - Output ONLY dataset IDs.
-        - NO text, NO explanation, NO punctuation.
+        - Output ONLY dataset IDs as {{"ids": [...]}}.
         - If unsure, output at least one dataset
         - If multiple topics, output all relevant IDs.
 
@@ -126,24 +102,19 @@ class DatasetSearchTool:
         {alias_lines}
 
         Examples:
-        Q: "rainfall effect on rice yield"  -> 5 3
-        Q: "number of PM Kisan beneficiaries in UP" -> 1
-        Q: "sugarcane production by district in Maharashtra" -> 3
-        Q: "compare crop data Maharashtra vs Karnataka" -> 3
-        Q: "education scheme growth in Bihar" -> -1
+        Q: "rainfall effect on rice yield"  -> {{"ids": [5, 3]}}
+        Q: "number of PM Kisan beneficiaries in UP" -> {{"ids": [1]}}
+        Q: "sugarcane production by district in Maharashtra" -> {{"ids": [3]}}
+        Q: "compare crop data Maharashtra vs Karnataka" -> {{"ids": [3]}}
+        Q: "education scheme growth in Bihar" -> {{"ids": [-1]}}
 
         User query: "{query}"
         Answer:
         """
-        raw = ollama.chat(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "Return ONLY numbers. No text."},
-                {"role": "user", "content": prompt},
-            ],
-        ).get("message", {}).get("content", "").strip()
-
-        ids = self._extract_numbers(raw)
+        # structured output: the reply can only be known IDs (or -1)
+        out = self.llm.chat_json(prompt, choice_schema("ids", [*self.dataset_ids, -1]),
+                                 system="Return ONLY the JSON object.")
+        ids = out["ids"] if out else [-1]
         valid = [self.dataset_ids[i] for i in ids if i in self.dataset_ids]
 
         # Apply PM-KISAN logic again post-LLM
@@ -156,8 +127,3 @@ class DatasetSearchTool:
             valid = ["Crop Development & Seed Production"]
 
         return {"selected_datasets": valid}
-
-    # ---- utils ----
-    def _extract_numbers(self, text: str) -> list[int]:
-        nums = re.findall(r"-?\d+", text)
-        return [abs(int(n)) for n in nums] if nums else [-1]
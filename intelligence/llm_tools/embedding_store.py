@@ -0,0 +1,144 @@
+# intelligence/llm_tools/embedding_store.py
+"""
+Consolidated, incremental embedding store for catalog entries.
+
+One store per embedding model and backend (intelligence/embedding_cache/store/<tag>/):
+
+    vecs.npy        float16 (capacity, dim); opened with mmap_mode, so a
+                    process only pages in the rows it reads
+    manifest.json   {"rows": n, "ids": {dataset id: [row, text sha1]}}
+
+`sync(items)` hashes each entry's text and encodes only the ids that are
+new or whose text changed: new ids are appended (the file grows by doubling),
+changed ones are overwritten in place. The manifest is replaced atomically
+after the vectors are flushed, so a crash mid-sync leaves the old state.
+
+`matrix(rows)` gathers rows as float32 (numpy has no fast float16 matmul)
+and keeps the result per row set until the store changes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from .embeddings import embedder, embedding_models
+
+EMBEDDING_STORE_DIR = "intelligence/embedding_cache/store"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, model: str = "bge", root: str = EMBEDDING_STORE_DIR):
+        self.model = model
+        self.tag = embedding_models().tag(model)
+        self.dir = os.path.join(root, self.tag)
+        self.vec_path = os.path.join(self.dir, "vecs.npy")
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self._lock = threading.Lock()
+        self._views = {}        # rows digest -> float32 matrix
+        os.makedirs(self.dir, exist_ok=True)
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            self.vecs = np.load(self.vec_path, mmap_mode="r")
+        except (OSError, ValueError):
+            self.manifest = {"model": self.tag, "dim": None, "rows": 0, "ids": {}}
+            self.vecs = None
+        self.stats = {"encoded": 0, "appended": 0, "updated": 0}
+        self.updated = []       # rows re-encoded in place (the ANN index re-assigns them)
+
+    # ---- writes ----
+    def _ensure_capacity(self, rows: int, dim: int):
+        capacity = 0 if self.vecs is None else self.vecs.shape[0]
+        if rows <= capacity:
+            return
+        new = np.lib.format.open_memmap(self.vec_path + ".tmp", mode="w+", dtype=np.float16,
+                                        shape=(max(rows, 2 * capacity, 64), dim))
+        if capacity:
+            new[:self.manifest["rows"]] = self.vecs[:self.manifest["rows"]]
+        new.flush()
+        del new
+        os.replace(self.vec_path + ".tmp", self.vec_path)
+
+    def _save_manifest(self):
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def sync(self, items: list[tuple[str, str]]) -> np.ndarray:
+        """
+        Make sure every (id, text) has an up-to-date vector; returns their
+        row numbers in the order given.
+        """
+        with self._lock:
+            ids = self.manifest["ids"]
+            hashes = [text_hash(text) for _, text in items]
+            stale = {}      # id -> (text, hash), de-duplicated
+            for (key, text), h in zip(items, hashes):
+                if ids.get(key, (None, None))[1] != h:
+                    stale[key] = (text, h)
+
+            if stale:
+                vecs = embedder(self.model).encode([t for t, _ in stale.values()], cache=False)
+                dim = vecs.shape[1]
+                new_ids = [k for k in stale if k not in ids]
+                self._ensure_capacity(self.manifest["rows"] + len(new_ids), dim)
+                mm = np.load(self.vec_path, mmap_mode="r+")
+                for key, vec in zip(stale, vecs):
+                    if key in ids:
+                        row = ids[key][0]
+                        self.updated.append(row)
+                        self.stats["updated"] += 1
+                    else:
+                        row = self.manifest["rows"]
+                        self.manifest["rows"] += 1
+                        self.stats["appended"] += 1
+                    mm[row] = vec
+                    ids[key] = [row, stale[key][1]]
+                mm.flush()
+                del mm
+                self.manifest["dim"] = dim
+                self._save_manifest()
+                self.vecs = np.load(self.vec_path, mmap_mode="r")
+                self._views.clear()
+                self.stats["encoded"] += len(stale)
+                print(f"💾 Embedding store ({self.model}): encoded {len(stale)} changed entries")
+
+            return np.array([ids[key][0] for key, _ in items], dtype=np.int64)
+
+    # ---- reads ----
+    def matrix(self, rows: np.ndarray) -> np.ndarray:
+        """float32 copy of `rows`, cached until the next sync that changes anything."""
+        digest = hashlib.sha1(np.ascontiguousarray(rows).tobytes()).hexdigest()
+        with self._lock:
+            view = self._views.get(digest)
+            if view is None:
+                if self.vecs is None or not len(rows):
+                    view = np.zeros((len(rows), self.manifest["dim"] or 0), dtype=np.float32)
+                else:
+                    view = np.asarray(self.vecs[rows], dtype=np.float32)
+                self._views[digest] = view
+            return view
+
+    def status(self) -> dict:
+        return {"rows": self.manifest["rows"], "dim": self.manifest["dim"],
+                "capacity": 0 if self.vecs is None else int(self.vecs.shape[0]), **self.stats}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def embedding_store(model: str = "bge") -> EmbeddingStore:
+    """Process-wide store per model."""
+    with _stores_lock:
+        if model not in _stores:
+            _stores[model] = EmbeddingStore(model)
+        return _stores[model]
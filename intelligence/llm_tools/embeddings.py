@@ -0,0 +1,413 @@
+# intelligence/llm_tools/embeddings.py
+"""
+Process-wide registry of the SentenceTransformer models the selectors use.
+
+Every request builds a fresh AnalysisOrchestrator (and FileSearchTool /
+PMKisanSelector per family), so loading models in their constructors put
+several seconds of disk reads in the hot path. Here each model is loaded
+once, on first use (or at startup via `warmup`), and stays pinned for the
+life of the process; all selectors share the same instance.
+
+EMBED_TORCH_THREADS caps torch's intra-op threads (0 = torch default) so
+encoding doesn't fight the pandas pool for cores.
+
+EMBED_BACKEND picks the runtime behind the same encode():
+  torch       full-precision PyTorch (default)
+  onnx        ONNX Runtime export of the same weights
+  onnx-int8   ONNX with dynamically quantised int8 weights (EMBED_ONNX_QCONFIG
+              = avx2 | avx512 | avx512_vnni | arm64); several times faster
+              on CPU and a fraction of the resident size
+The ONNX files are exported next to the local model on first use (needs
+optimum[onnxruntime]); without it the backend falls back to torch. Vectors
+from different backends aren't mixed: stores and indexes are keyed by
+`tag(name)`. SentenceTransformer.encode sorts each batch by length, so
+padding stays per-batch rather than per-longest-text.
+
+    python -m intelligence.llm_tools.embeddings --parity   # int8 vs torch rankings
+
+Selectors don't call the models directly: they go through EmbeddingService,
+a single "embed" worker thread that
+
+  - gathers encode calls arriving within EMBED_BATCH_WINDOW_MS (from any
+    request) and runs them as one batch per model,
+  - keeps an LRU of (model, text) -> vector, so the same query embedded by
+    the family selector, the answer cache and the plan library is encoded
+    once,
+  - is the only thread that runs torch, so embedding work is capped at
+    EMBED_TORCH_THREADS cores instead of borrowing the pandas pool's.
+Cross-encoder scoring (`score`, the file re-ranker) runs on the same worker.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from sentence_transformers import CrossEncoder, SentenceTransformer
+
+# short name -> (local path, hub id used to fetch it the first time)
+EMBEDDING_MODELS = {
+    "minilm": ("./models/all-MiniLM-L6-v2", "all-MiniLM-L6-v2"),
+    "bge": ("./models/bge-base-en-v1.5", "BAAI/bge-base-en-v1.5"),
+}
+# (query, passage) scorers, loaded and pinned the same way (always torch)
+CROSS_ENCODERS = {
+    "rerank": ("./models/ms-marco-MiniLM-L-6-v2", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+}
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_ONNX_QCONFIG = os.getenv("EMBED_ONNX_QCONFIG", "avx2")
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))       # encode calls merged per batch
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))   # cached (model, text) vectors
+
+
+class EmbeddingModels:
+    """Lazily loaded, never evicted SentenceTransformer instances."""
+
+    def __init__(self, models: dict = EMBEDDING_MODELS, torch_threads: int = EMBED_TORCH_THREADS,
+                 backend: str = EMBED_BACKEND):
+        self.models = {**models, **CROSS_ENCODERS}
+        self.torch_threads = torch_threads
+        self.backend = backend
+        self.backends = {}      # name -> backend actually loaded
+        self._lock = threading.Lock()
+        self._model_locks = {name: threading.Lock() for name in self.models}
+        self._loaded = {}
+        self.load_s = {}        # name -> seconds spent loading
+        self._threads_set = False
+
+    def _set_threads(self):
+        if self._threads_set or self.torch_threads <= 0:
+            return
+        import torch
+        torch.set_num_threads(self.torch_threads)
+        self._threads_set = True
+
+    @staticmethod
+    def _load_torch(path: str, hub_id: str, cls=SentenceTransformer):
+        try:
+            if not os.path.exists(path):
+                raise FileNotFoundError
+            return cls(path, device="cpu", local_files_only=True)
+        except Exception:
+            print(f"⚠️ Local embedding model {path} not found. Downloading...")
+            model = cls(hub_id, device="cpu")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            model.save(path)
+            print("✅ Model cached locally.")
+            return cls(path, device="cpu", local_files_only=True)
+
+    def _load_onnx(self, path: str, hub_id: str, quantize: bool):
+        if not os.path.exists(path):
+            self._load_torch(path, hub_id)      # fetch + save the weights first
+        onnx_file = os.path.join("onnx", "model.onnx")
+        if not os.path.exists(os.path.join(path, onnx_file)):
+            model = SentenceTransformer(path, device="cpu", backend="onnx", local_files_only=True)
+            model.save_pretrained(path)
+            print(f"✅ Exported {path} to ONNX.")
+        if not quantize:
+            return SentenceTransformer(path, device="cpu", backend="onnx", local_files_only=True)
+        qfile = os.path.join("onnx", f"model_qint8_{EMBED_ONNX_QCONFIG}.onnx")
+        if not os.path.exists(os.path.join(path, qfile)):
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            model = SentenceTransformer(path, device="cpu", backend="onnx", local_files_only=True)
+            export_dynamic_quantized_onnx_model(model, EMBED_ONNX_QCONFIG, path)
+            print(f"✅ Quantised {path} to int8 ({EMBED_ONNX_QCONFIG}).")
+        return SentenceTransformer(path, device="cpu", backend="onnx", local_files_only=True,
+                                   model_kwargs={"file_name": qfile})
+
+    def _load(self, name: str):
+        path, hub_id = self.models[name]
+        if name in CROSS_ENCODERS:
+            self.backends[name] = "torch"
+            return self._load_torch(path, hub_id, cls=CrossEncoder)
+        if self.backend in ("onnx", "onnx-int8"):
+            try:
+                model = self._load_onnx(path, hub_id, quantize=self.backend == "onnx-int8")
+                self.backends[name] = self.backend
+                return model
+            except Exception as e:
+                print(f"⚠️ {self.backend} backend unavailable for {name} ({e}); using torch.")
+        self.backends[name] = "torch"
+        return self._load_torch(path, hub_id)
+
+    def tag(self, name: str) -> str:
+        """Name + backend actually loaded, for anything that persists this model's vectors."""
+        self.get(name)
+        backend = self.backends[name]
+        return name if backend == "torch" else f"{name}-{backend}"
+
+    def get(self, name: str) -> SentenceTransformer:
+        model = self._loaded.get(name)
+        if model is not None:
+            return model
+        if name not in self.models:
+            raise KeyError(f"Unknown embedding model '{name}'")
+        # one lock per model: loading bge doesn't hold up a MiniLM caller
+        with self._model_locks[name]:
+            if name not in self._loaded:
+                with self._lock:
+                    self._set_threads()
+                t0 = time.perf_counter()
+                self._loaded[name] = self._load(name)
+                self.load_s[name] = round(time.perf_counter() - t0, 3)
+                print(f"🧠 Loaded embedding model {name} in {self.load_s[name]:.1f}s")
+        return self._loaded[name]
+
+    def warmup(self, names: list[str]):
+        """Load `names` up-front (FastAPI startup) and run one encode each."""
+        for name in names:
+            try:
+                model = self.get(name)
+                if isinstance(model, CrossEncoder):
+                    model.predict([("warmup", "warmup")])
+                else:
+                    model.encode(["warmup"], normalize_embeddings=True)
+            except Exception as e:
+                print(f"⚠️ Embedding warmup failed for {name}: {e}")
+
+    def status(self) -> dict:
+        return {"loaded": list(self._loaded), "load_s": dict(self.load_s), "backends": dict(self.backends),
+                "torch_threads": self.torch_threads or None}
+
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def embedding_models() -> EmbeddingModels:
+    """Process-wide embedding model registry."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = EmbeddingModels()
+        return _embeddings
+
+
+def sentence_model(name: str) -> SentenceTransformer:
+    return embedding_models().get(name)
+
+
+class _Job:
+    __slots__ = ("model", "texts", "pairs", "future")
+
+    def __init__(self, model: str, texts: list[str], pairs: list | None = None):
+        self.model = model
+        self.texts = texts
+        self.pairs = pairs      # cross-encoder job: [(query, passage), ...]
+        self.future = Future()
+
+
+class EmbeddingService:
+    """Micro-batching, caching front of EmbeddingModels (see module docstring)."""
+
+    def __init__(self, models: EmbeddingModels | None = None, window_ms: float = EMBED_BATCH_WINDOW_MS,
+                 max_batch: int = EMBED_MAX_BATCH, cache_size: int = EMBED_CACHE_SIZE):
+        self.models = models or embedding_models()
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._queue = queue.Queue()
+        self._cache = OrderedDict()     # (model, text) -> vector
+        self._lock = threading.Lock()
+        self._worker = None
+        self.stats = {"calls": 0, "texts": 0, "cache_hits": 0, "batches": 0, "encoded": 0, "scored": 0}
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embed", daemon=True)
+                self._worker.start()
+
+    def _gather(self) -> list:
+        jobs = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(jobs) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._gather()
+            by_model = {}
+            for job in jobs:
+                if job.pairs is not None:
+                    self._score(job)
+                    continue
+                by_model.setdefault(job.model, []).append(job)
+            for name, group in by_model.items():
+                texts = list(dict.fromkeys(t for job in group for t in job.texts))
+                try:
+                    vecs = self.models.get(name).encode(texts, normalize_embeddings=True)
+                except Exception as e:
+                    for job in group:
+                        job.future.set_exception(e)
+                    continue
+                vecs = np.asarray(vecs, dtype=np.float32)
+                row = {t: i for i, t in enumerate(texts)}
+                with self._lock:
+                    self.stats["batches"] += 1
+                    self.stats["encoded"] += len(texts)
+                for job in group:
+                    job.future.set_result(vecs[[row[t] for t in job.texts]])
+
+    def _score(self, job):
+        try:
+            scores = self.models.get(job.model).predict(job.pairs)
+        except Exception as e:
+            job.future.set_exception(e)
+            return
+        with self._lock:
+            self.stats["scored"] += len(job.pairs)
+        job.future.set_result(np.asarray(scores, dtype=np.float32))
+
+    def score(self, name: str, query: str, passages: list[str]) -> np.ndarray:
+        """Cross-encoder relevance logits of (query, passage) pairs, run on the embed worker."""
+        if not passages:
+            return np.zeros(0, dtype=np.float32)
+        self._start()
+        job = _Job(name, [], pairs=[(query, p) for p in passages])
+        self._queue.put(job)
+        return job.future.result()
+
+    def encode(self, name: str, texts: list[str], cache: bool = True) -> np.ndarray:
+        """
+        Normalised embeddings of `texts`, shape (len(texts), dim). Blocks until
+        the worker's next batch is done. `cache=False` for one-off corpora
+        (title lists) that would only push queries out of the LRU.
+        """
+        texts = [str(t) for t in texts]
+        found, missing = {}, []
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["texts"] += len(texts)
+            for t in dict.fromkeys(texts):
+                vec = self._cache.get((name, t))
+                if vec is None:
+                    missing.append(t)
+                else:
+                    self._cache.move_to_end((name, t))
+                    found[t] = vec
+            self.stats["cache_hits"] += len(found)
+        if missing:
+            self._start()
+            job = _Job(name, missing)
+            self._queue.put(job)
+            vecs = job.future.result()
+            found.update(zip(missing, vecs))
+            if cache:
+                with self._lock:
+                    for t, vec in zip(missing, vecs):
+                        self._cache[(name, t)] = vec
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[t] for t in texts])
+
+    def status(self) -> dict:
+        with self._lock:
+            texts = self.stats["texts"]
+            return {**self.models.status(), **self.stats, "cached": len(self._cache),
+                    "hit_rate": round(self.stats["cache_hits"] / texts, 3) if texts else None}
+
+
+class Embedder:
+    """One model's view of the service; what the selectors hold."""
+
+    def __init__(self, name: str, service: EmbeddingService):
+        self.name = name
+        self.service = service
+
+    def encode(self, texts: list[str], cache: bool = True) -> np.ndarray:
+        return self.service.encode(self.name, texts, cache=cache)
+
+    def encode_one(self, text: str) -> np.ndarray:
+        return self.service.encode(self.name, [text])[0]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def embedding_service() -> EmbeddingService:
+    """Process-wide embedding service."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+        return _service
+
+
+def embedder(name: str) -> Embedder:
+    return Embedder(name, embedding_service())
+
+
+def parity(name: str, queries: list[str], corpus: list[str], backend: str = "onnx-int8", k: int = 10) -> dict:
+    """Retrieval agreement between torch and `backend` for one model."""
+    results = {}
+    for b in ("torch", backend):
+        model = EmbeddingModels(backend=b).get(name)
+        t0 = time.perf_counter()
+        docs = np.asarray(model.encode(corpus, normalize_embeddings=True), dtype=np.float32)
+        encode_s = time.perf_counter() - t0
+        qs = np.asarray(model.encode(queries, normalize_embeddings=True), dtype=np.float32)
+        results[b] = {"docs": docs, "top": np.argsort(-(qs @ docs.T), axis=1)[:, :k], "encode_s": encode_s}
+    ref, alt = results["torch"], results[backend]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref["top"], alt["top"])]
+    return {
+        "model": name, "backend": backend, "queries": len(queries), "corpus": len(corpus),
+        "top1_agreement": float(np.mean(ref["top"][:, 0] == alt["top"][:, 0])),
+        f"top{k}_overlap": float(np.mean(overlap)),
+        "min_cosine": float((ref["docs"] * alt["docs"]).sum(axis=1).min()),
+        "speedup": round(ref["encode_s"] / max(alt["encode_s"], 1e-9), 2),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Embedding backend tools")
+    parser.add_argument("--parity", action="store_true", help="compare rankings of --backend against torch")
+    parser.add_argument("--backend", default="onnx-int8")
+    parser.add_argument("--min-overlap", type=float, default=0.9)
+    parser.add_argument("--min-top1", type=float, default=0.9)
+    args = parser.parse_args()
+    if not args.parity:
+        parser.print_help()
+        sys.exit(0)
+
+    with open("dataHandlers/data/sectors/sector_index.json", encoding="utf-8") as f:
+        sectors = json.load(f)
+    corpus = []
+    for path in sectors.values():
+        data = json.load(open(path))
+        if "states" in data:
+            corpus.extend(data["states"])
+            continue
+        for entries in data.values():
+            corpus.extend(e.get("title", "") for e in entries)
+    with open("intelligence/benchmark_queries.txt", encoding="utf-8") as f:
+        queries = [q.strip() for q in f if q.strip() and not q.startswith("#")]
+    queries += ["rainfall in Kerala", "wheat varieties released", "PM-KISAN beneficiaries in Bihar",
+                "temperature trend in north east India", "sugarcane production by district"]
+
+    failed = False
+    for name in EMBEDDING_MODELS:       # cross-encoders always run on torch
+        report = parity(name, queries, corpus, backend=args.backend)
+        ok = report["top10_overlap"] >= args.min_overlap and report["top1_agreement"] >= args.min_top1
+        failed |= not ok
+        print(("✅ " if ok else "❌ ") + json.dumps(report))
+    sys.exit(1 if failed else 0)
@@ -1,200 +1,312 @@
 # intelligence/llm_tools/file_search_tool.py
+import datetime
+import hashlib
+import os
 import re
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from .local_llm import LocalLLM
-import os
-import ollama
+from .embeddings import embedder, embedding_service
+from .embedding_store import embedding_store
+from .ann_index import catalog_index, spherical_kmeans, ANN_EXACT_LIMIT
+from .lexical_index import lexical_index
+from .local_llm import LocalLLM, choice_schema
+
+# state/UT -> region names used in dataset titles (for boosting)
+REGION_ALIASES = {
+    "Andhra Pradesh": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
+    "Arunachal Pradesh": ["North East India", "NE India"],
+    "Assam": ["North East India", "NE India"],
+    "Bihar": ["North East India", "NE India"],
+    "Chhattisgarh": ["Central India"],
+    "Goa": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
+    "Gujarat": ["North West India", "NW India"],
+    "Haryana": ["North West India", "NW India"],
+    "Himachal Pradesh": ["North West India", "NW India"],
+    "Jharkhand": ["East India", "Central India"],
+    "Karnataka": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
+    "Kerala": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
+    "Madhya Pradesh": ["Central India"],
+    "Maharashtra": ["Central India", "South Peninsula"],
+    "Manipur": ["North East India", "NE India"],
+    "Meghalaya": ["North East India", "NE India"],
+    "Mizoram": ["North East India", "NE India"],
+    "Nagaland": ["North East India", "NE India"],
+    "Odisha": ["East India", "Central India"],
+    "Punjab": ["North West India", "NW India"],
+    "Rajasthan": ["North West India", "NW India"],
+    "Sikkim": ["North East India", "NE India"],
+    "Tamil Nadu": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
+    "Telangana": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
+    "Tripura": ["North East India", "NE India"],
+    "Uttar Pradesh": ["North India", "Central India"],
+    "Uttarakhand": ["North India", "North West India"],
+    "West Bengal": ["East India", "North East India"],
+    "Delhi": ["North India", "North West India"],
+    "Jammu & Kashmir": ["North India", "North West India"],
+    "Ladakh": ["North India", "North West India"],
+    "Puducherry": ["South Peninsula", "Southern Peninsula"],
+    "Andaman & Nicobar Islands": ["South Peninsula", "Bay of Bengal", "Island regions"],
+    "Chandigarh": ["North India", "North West India"],
+    "Lakshadweep": ["South Peninsula", "Arabian Sea", "Island regions"],
+    "Dadra and Nagar Haveli and Daman and Diu": ["West Coast", "North West India"]
+}
+
+_YEAR_RE = re.compile(r"(?:19|20)\d{2}")
+
+# stage-2 re-ranker: "cross-encoder" (LLM only when its scores are ambiguous) or "llm"
+FILE_RERANKER = os.getenv("FILE_RERANKER", "cross-encoder")
+# below this probability for the best candidate the cross-encoder defers to the LLM
+RERANK_MIN_PROB = float(os.getenv("RERANK_MIN_PROB", "0.3"))
+# keep candidates within this fraction of the best probability (at most 3)
+RERANK_KEEP_RATIO = float(os.getenv("RERANK_KEEP_RATIO", "0.5"))
+# LLM fallback sees at most SHORTLIST_SIZE titles, drawn from SHORTLIST_TOPICS clusters
+SHORTLIST_SIZE = int(os.getenv("SHORTLIST_SIZE", "15"))
+SHORTLIST_TOPICS = int(os.getenv("SHORTLIST_TOPICS", "5"))
+# reciprocal rank fusion of the dense and BM25 rankings: 1 / (RRF_K + rank)
+RRF_K = int(os.getenv("RRF_K", "60"))
+# a BM25 hit below the dense threshold is still recalled when it holds this
+# idf-weighted share of the query's terms
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.6"))
+
+
+class TitleFeatures:
+    """
+    Boost features of a title list, computed once per distinct list:
+    the years each title mentions (0-padded matrix) and which region
+    aliases it contains (0/1 matrix over every alias in REGION_ALIASES).
+    """
+
+    def __init__(self, titles: list[str]):
+        years = [[int(y) for y in _YEAR_RE.findall(t)] for t in titles]
+        self.years = np.zeros((len(titles), max((len(y) for y in years), default=0)), dtype=np.int32)
+        for i, ys in enumerate(years):
+            self.years[i, :len(ys)] = ys
+        self.aliases = sorted({a.lower() for names in REGION_ALIASES.values() for a in names})
+        self.alias_index = {a: j for j, a in enumerate(self.aliases)}
+        lowered = [t.lower() for t in titles]
+        self.regions = np.array([[a in t for a in self.aliases] for t in lowered],
+                                dtype=np.float32).reshape(len(titles), len(self.aliases))
+
+
+_FEATURES = {}      # family -> (titles digest, TitleFeatures)
+
+
+def title_features(family: str, titles: list[str]) -> TitleFeatures:
+    digest = hashlib.sha1("\n".join(titles).encode("utf-8")).hexdigest()
+    cached = _FEATURES.get(family)
+    if cached is None or cached[0] != digest:
+        cached = _FEATURES[family] = (digest, TitleFeatures(titles))
+    return cached[1]
+
 
 class FileSearchTool:
     """
     Stage-2 selector for Build for Bharat.
 
     Given a dataset family (e.g. "Temperature and Rainfall") and a user query,
-    retrieves top-k candidate files using hybrid (semantic + heuristic) scoring,
+    retrieves top-k candidate files using hybrid (semantic + BM25 + heuristic) scoring,
     then refines the ranking via a local LLM to pick the most relevant few.
     """
 
-    def __init__(self, family_index: dict, model="qwen2.5:14b", cache_dir="intelligence/embedding_cache/"):
+    def __init__(self, family_index: dict, model="qwen2.5:14b"):
         # unwrap: {"Temperature and Rainfall": [ {...}, {...} ]}
         # breakpoint()
-        os.makedirs(cache_dir, mode=0o777, exist_ok=True)
         if isinstance(family_index, dict):
             self.family_name, entries = next(iter(family_index.items()))
         else:
             self.family_name, entries = "unknown", family_index
 
         self.family_index = entries  # list[{id,title,index}]
-        # self.llm = LocalLLM(model=model)
+        self.llm = LocalLLM(model=model)
         self.model = model
-        try:
-            model_path = "./models/bge-base-en-v1.5"
-            if not os.path.exists(model_path):
-                raise FileNotFoundError
-
-            self.sentence_model = SentenceTransformer(
-                model_path,
-                device="cpu",
-                local_files_only=True
-            )
-        except Exception:
-            print("⚠️ Local embedding model not found. Downloading...")
-            self.sentence_model = SentenceTransformer("BAAI/bge-base-en-v1.5" , device="cpu")
-            os.makedirs("./models", exist_ok=True)
-            self.sentence_model.save(model_path)
-            self.sentence_model = SentenceTransformer(
-                model_path,
-                device="cpu",
-                local_files_only=True
-            )
-            print("✅ Model cached locally.")
-
-        self.cache_path = cache_dir
+        self.embedder = embedder("bge")
+
         # simple state/UT list for boosting
-        self.region_aliases = {
-            "Andhra Pradesh": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
-            "Arunachal Pradesh": ["North East India", "NE India"],
-            "Assam": ["North East India", "NE India"],
-            "Bihar": ["North East India", "NE India"],
-            "Chhattisgarh": ["Central India"],
-            "Goa": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
-            "Gujarat": ["North West India", "NW India"],
-            "Haryana": ["North West India", "NW India"],
-            "Himachal Pradesh": ["North West India", "NW India"],
-            "Jharkhand": ["East India", "Central India"],
-            "Karnataka": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
-            "Kerala": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
-            "Madhya Pradesh": ["Central India"],
-            "Maharashtra": ["Central India", "South Peninsula"],
-            "Manipur": ["North East India", "NE India"],
-            "Meghalaya": ["North East India", "NE India"],
-            "Mizoram": ["North East India", "NE India"],
-            "Nagaland": ["North East India", "NE India"],
-            "Odisha": ["East India", "Central India"],
-            "Punjab": ["North West India", "NW India"],
-            "Rajasthan": ["North West India", "NW India"],
-            "Sikkim": ["North East India", "NE India"],
-            "Tamil Nadu": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
-            "Telangana": ["South Peninsula", "Southern Peninsula", "Peninsular India"],
-            "Tripura": ["North East India", "NE India"],
-            "Uttar Pradesh": ["North India", "Central India"],
-            "Uttarakhand": ["North India", "North West India"],
-            "West Bengal": ["East India", "North East India"],
-            "Delhi": ["North India", "North West India"],
-            "Jammu & Kashmir": ["North India", "North West India"],
-            "Ladakh": ["North India", "North West India"],
-            "Puducherry": ["South Peninsula", "Southern Peninsula"],
-            "Andaman & Nicobar Islands": ["South Peninsula", "Bay of Bengal", "Island regions"],
-            "Chandigarh": ["North India", "North West India"],
-            "Lakshadweep": ["South Peninsula", "Arabian Sea", "Island regions"],
-            "Dadra and Nagar Haveli and Daman and Diu": ["West Coast", "North West India"]
-        }
-
-        if os.path.exists(self.cache_path):
-            try:
-                cached = np.load(self.cache_path + self.family_name + ".npz", allow_pickle=True)
-                self.titles = list(cached["titles"])
-                if self._cache_valid():
-                    self.vecs = cached["vecs"]
-                    print(f"✅ Loaded cached embeddings for {self.family_name}")
-                else:
-                    print(f"⚠️ Cache outdated for {self.family_name} — recomputing...")
-                    self._recompute_and_save()
-            except Exception as e:
-                print(f"⚠️ Cache read error for {self.family_name}: {e}. Recomputing...")
-                self._recompute_and_save()
-        else:
-            print(f"🆕 No cache found for {self.family_name}, computing embeddings...")
-            self._recompute_and_save()
+        self.region_aliases = REGION_ALIASES
 
-    # ----------------------------------------------------------------
-    def _cache_valid(self):
-        current_titles = [d["title"] for d in self.family_index]
-        return getattr(self, "titles", []) == current_titles
+        # vectors live in the shared float16 store; only new/changed entries get encoded
+        self.store = embedding_store("bge")
+        self.entries = list(self.family_index)
+        self.titles = [e.get("title", "") for e in self.entries]
+        self.features = title_features(self.family_name, self.titles)
+        self.lexicon = lexical_index(self.family_name, self.entries)
+        self.rows = self.store.sync([(self._entry_key(d), self._entry_text(d)) for d in self.entries])
+        self.ann = catalog_index("bge")
+        self.ann.add(self.rows, self.family_name)
+        # small families: exact scores over a cached float32 matrix; large ones go through the ANN index
+        self.vecs = self.store.matrix(self.rows) if len(self.rows) <= ANN_EXACT_LIMIT else None
 
     # ----------------------------------------------------------------
-    def _recompute_and_save(self):
+    @staticmethod
+    def _entry_key(d: dict) -> str:
+        return str(d.get("id") or d.get("title", ""))
+
+    @staticmethod
+    def _entry_text(d: dict) -> str:
         import json
-        self.entries = []
-        texts = []
-        for d in self.family_index:
-            meta = [d.get("title", "")]
-            if "describe" in d:
-                meta.append(json.dumps(d["describe"]))
-            elif "preview" in d:
-                meta.append(d["preview"])
-            texts.append(" ".join(meta))
-            self.entries.append(d)
-        self.titles = [e.get("title", "") for e in self.entries]
-        self.vecs = self.sentence_model.encode(texts, normalize_embeddings=True)
-        np.savez(self.cache_path + self.family_name,
-                vecs=self.vecs, titles=self.titles)
-        print(f"💾 saved enhanced cache for {self.family_name}")
+        meta = [d.get("title", "")]
+        if "describe" in d:
+            meta.append(json.dumps(d["describe"]))
+        elif "preview" in d:
+            meta.append(d["preview"])
+        return " ".join(meta)
 
     # ------------------------------------------------------------------
-    def _apply_boosts(self, query: str, title: str, base_score: float) -> float:
-        
-        import datetime
-
-        score = base_score
+    def _apply_boosts(self, query: str, base: np.ndarray, positions=None) -> np.ndarray:
+        """Boosted scores for the titles at `positions` (all titles if None)."""
+        f = self.features
+        pos = slice(None) if positions is None else positions
+        score = np.asarray(base, dtype=np.float64).copy()
         current_year = datetime.datetime.now().year
 
-        # temporal cues: reward proximity
-        years = re.findall(r"(19|20)\d{2}", query)
-        for y in years:
-            try:
-                y_int = int(y)
-                delta = max(0, min(10, current_year - y_int))
-                score += max(0, 0.15 - 0.015 * delta)
-            except ValueError:
-                pass
-
-        # 'last N years' handling
-        if m := re.search(r"last\s+(\d+)\s+year", query):
+        # temporal cues: reward proximity (same for every title)
+        for y in _YEAR_RE.findall(query):
+            delta = max(0, min(10, current_year - int(y)))
+            score += max(0, 0.15 - 0.015 * delta)
+
+        # 'last N years' handling: +0.1 per title year inside the window
+        if f.years.size and (m := re.search(r"last\s+(\d+)\s+year", query)):
             window = int(m.group(1))
-            for y in re.findall(r"(19|20)\d{2}", title):
-                if current_year - int(y) <= window:
-                    score += 0.1
+            years = f.years[pos]
+            score += 0.1 * ((years > 0) & (current_year - years <= window)).sum(axis=1)
 
         # recent/last keyword fallback
         if "recent" in query or "last" in query:
             score += 0.03
 
-        # geographic matches
-        for state, aliases in self.region_aliases.items():
-            if state.lower() in query.lower():
+        # geographic matches: +0.18 per alias of each mentioned state found in the title
+        weights = np.zeros(len(f.aliases), dtype=np.float32)
+        q = query.lower()
+        for state, aliases in REGION_ALIASES.items():
+            if state.lower() in q:
                 for alias in aliases:
-                    if alias.lower() in title.lower():
-                        score += 0.18
-
+                    weights[f.alias_index[alias.lower()]] += 1
+        if weights.any():
+            score += 0.18 * (f.regions[pos] @ weights)
 
-        return min(score, 1.0)
+        return np.minimum(score, 1.0)
 
 
     # ------------------------------------------------------------------
+    def _candidates(self, qvec, pool: int = 200):
+        """(positions in family_index, cosine scores) — all entries, or the ANN top `pool`."""
+        if self.vecs is not None:
+            return np.arange(len(self.rows)), self.vecs @ qvec
+        rows, scores = self.ann.search(qvec, k=pool, family=self.family_name)
+        order = np.argsort(self.rows)
+        positions = order[np.searchsorted(self.rows, rows, sorter=order)]
+        return positions, scores
+
+    def _dense(self, query: str, qvec, bm25=None, pool: int = 200) -> np.ndarray:
+        """
+        Boosted cosine per title, -1 outside the candidate pool. The best
+        `pool` BM25 hits are scored too, so a lexical match the ANN probe
+        missed still gets a dense rank.
+        """
+        positions, base = self._candidates(qvec, pool)
+        if bm25 is not None:
+            hits = np.flatnonzero(bm25 > 0)
+            extra = np.setdiff1d(hits[np.argsort(-bm25[hits])[:pool]], positions)
+            if len(extra):
+                vecs = np.asarray(self.store.vecs[self.rows[extra]], dtype=np.float32)
+                positions, base = np.concatenate([positions, extra]), np.concatenate([base, vecs @ qvec])
+        sims = np.full(len(self.titles), -1.0)
+        sims[positions] = self._apply_boosts(query, base, positions)
+        return sims
+
     def retrieve(self, query: str, top_k: int = 10, threshold: float = 0.35):
-        """Hybrid semantic + boosted recall."""
-        qvec = self.sentence_model.encode([query], normalize_embeddings=True)[0]
-        sims = np.dot(self.vecs, qvec)
-        sims = [self._apply_boosts(query, t, float(s)) for t, s in zip(self.titles, sims)]
-        top_idx = np.argsort(-np.array(sims))[:top_k]
+        """
+        Hybrid recall: titles above the dense threshold plus BM25 hits that
+        cover most of the query's terms, ordered by reciprocal rank fusion
+        of the two rankings.
+        """
+        qvec = self.embedder.encode_one(query)
+        bm25, coverage = self.lexicon.search(query)
+        sims = self._dense(query, qvec, bm25)
+
+        fused = np.zeros(len(self.titles))
+        for score, valid in ((sims, sims > -1), (bm25, bm25 > 0)):
+            ranked = np.flatnonzero(valid)
+            ranked = ranked[np.argsort(-score[ranked], kind="stable")]
+            fused[ranked] += 1.0 / (RRF_K + np.arange(1, len(ranked) + 1))
+
+        admitted = np.flatnonzero((sims >= threshold) | ((bm25 > 0) & (coverage >= LEXICAL_MIN_COVERAGE)))
+        top_idx = admitted[np.argsort(-fused[admitted], kind="stable")[:top_k]]
 
         selected = [
             {"index": self.family_index[i]["index"], "title": self.family_index[i]["title"], "score": float(sims[i])}
-            for i in top_idx if sims[i] >= threshold
+            for i in top_idx
         ]
         return selected or [{"index": -1}]
 
 
     # ------------------------------------------------------------------
-    def select(self, query: str):
-        """Main entry: hybrid retrieval → LLM re-ranking."""
+    def shortlist(self, query: str, size: int = SHORTLIST_SIZE, pool: int = 60, floor: float = 0.2):
+        """
+        Positions of a bounded, topic-diverse candidate list for the LLM
+        fallback: BM25 hits plus dense hits above a lower `floor`, the
+        best `pool` of them clustered by topic, then taken round-robin from
+        the clusters (best first) up to `size`.
+        """
+        qvec = self.embedder.encode_one(query)
+        bm25, lexical = self.lexicon.search(query)
+        dense = self._dense(query, qvec, bm25)
+        score = dense + lexical
+        keep = np.flatnonzero((dense >= floor) | (lexical > 0))
+        if not len(keep):
+            keep = np.flatnonzero(dense > -1)
+        keep = keep[np.argsort(-score[keep])[:pool]]
+        if len(keep) <= size:
+            return keep
+
+        vecs = np.asarray(self.store.vecs[self.rows[keep]], dtype=np.float32)
+        centroids = spherical_kmeans(vecs, min(SHORTLIST_TOPICS, len(keep)))
+        topic = np.argmax(vecs @ centroids.T, axis=1)
+        # each cluster is already in score order; clusters ordered by their best member
+        clusters = [keep[topic == c] for c in dict.fromkeys(topic)]
+        picks = []
+        for rank in range(size):
+            for members in clusters:
+                if rank < len(members) and len(picks) < size:
+                    picks.append(members[rank])
+        return np.array(picks)
+
+    # ------------------------------------------------------------------
+    def cross_rerank(self, query: str, results: list, idx_map: dict):
+        """
+        Score (query, title + describe) pairs with the local cross-encoder.
+        Returns the top picks, or None when the scores are ambiguous (no
+        candidate is clearly relevant) or the re-ranker can't run.
+        """
+        passages = [self._entry_text(self.family_index[idx_map[r["index"]]]) for r in results]
+        try:
+            logits = embedding_service().score("rerank", query, passages)
+        except Exception as e:
+            print(f"⚠️ Cross-encoder re-rank failed ({e}); asking the LLM.")
+            return None
+        probs = 1 / (1 + np.exp(-logits))
+        order = np.argsort(-probs)
+        best = probs[order[0]]
+        if best < RERANK_MIN_PROB:
+            return None
+        return [{"index": results[i]["index"], "title": results[i]["title"]}
+                for i in order[:3] if probs[i] >= RERANK_KEEP_RATIO * best]
+
+    # ------------------------------------------------------------------
+    def select(self, query: str, on_candidates=None):
+        """
+        Main entry: hybrid retrieval → cross-encoder re-ranking (LLM when ambiguous).
+        `on_candidates(results)` is called with the retrieval hits before the
+        re-rank call, so the caller can start loading them speculatively.
+        """
         # breakpoint()
         results = self.retrieve(query)
+        if on_candidates and results and results[0]["index"] != -1:
+            on_candidates(results)
         idx_map = {d['index']: i for i, d in enumerate(self.family_index)}
         if not results or results[0]["index"] == -1:
-            # fallback full-reasoning on all titles
-            titles_text = "\n".join(f"{d['index']}. {d['title']}" for i, d in enumerate(self.family_index))
+            # fallback reasoning over a bounded shortlist, not the whole family
+            shortlist = [self.family_index[i] for i in self.shortlist(query)]
+            titles_text = "\n".join(f"{d['index']}. {d['title']}" for d in shortlist)
             prompt = f"""
             You are a dataset file selector. Choose which of the following datasets
             best answer the user's query.
@@ -205,19 +317,26 @@ class FileSearchTool:
             USER QUERY:
             "{query}"
 
-            Respond ONLY with the most relevant dataset number(s), separated by commas.
-            Return -1 if none match.
+            Respond ONLY with {{"indexes": [...]}} holding the most relevant dataset number(s).
+            Return [-1] if none match.
             """
             # breakpoint()
-            raw = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}]).get("message", {}).get("content", "").strip()
+            out = self.llm.chat_json(prompt, choice_schema("indexes", [d["index"] for d in shortlist] + [-1]))
             # breakpoint()
-            nums = [int(n) for n in re.findall(r"\d+", raw)] or [-1]
+            nums = out["indexes"] if out else [-1]
             selected = [
-                i for i in nums if 1 <= i
+                {'index': i, 'title': self.family_index[idx_map[i]]['title']}
+                for i in nums if i in idx_map
             ]
-            return {"selected_indexes": selected or [{"id": -1}]}
+            return {"selected_files": selected[:3] or [-1]}
+
+        # -------------------- cross-encoder re-ranking --------------------
+        if FILE_RERANKER == "cross-encoder":
+            reranked = self.cross_rerank(query, results, idx_map)
+            if reranked:
+                return {"selected_files": reranked}
 
-        # -------------------- LLM re-ranking --------------------
+        # -------------------- LLM re-ranking (fallback) --------------------
         # top_titles = [r["title"] for r in results]
         titles_text = "\n".join(f"{t['index']}. {t['title']}" for i, t in enumerate(results))
         prompt = f"""
@@ -231,13 +350,13 @@ class FileSearchTool:
             DATASETS:
             {titles_text}
 
-            Respond ONLY with the top 3 numbers (e.g., 2,5,1) in relevance order.
-            If unsure, include fewer. No explanations. Choose at least 1.
+            Respond ONLY with {{"indexes": [...]}} holding the top 3 numbers in relevance order.
+            If unsure, include fewer. Choose at least 1.
         """
         # breakpoint()
-        raw = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}]).get("message", {}).get("content", "").strip()
+        out = self.llm.chat_json(prompt, choice_schema("indexes", [r["index"] for r in results], max_items=3))
         # breakpoint()
-        nums = [int(n) for n in re.findall(r"\d+", raw)]
+        nums = out["indexes"] if out else []
 
         # reattach metadata after reranking
         # breakpoint()
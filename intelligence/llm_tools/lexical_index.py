@@ -0,0 +1,177 @@
+# intelligence/llm_tools/lexical_index.py
+"""
+In-process BM25 inverted index over catalog entries, the lexical half of
+FileSearchTool's hybrid retrieval.
+
+Dense vectors blur exact tokens — "2018-19", "11th instalment", "Vidarbha",
+crop names — so each family also gets a BM25 index over its titles plus
+the describe columns and unique values. Titles are counted twice so a
+match there outranks one buried in a column list.
+
+Terms: lower-cased tokens minus STOPWORDS, a trailing plural "s" dropped,
+financial years normalised ("2018-2019", "2018–19" -> "2018-19") with the
+start year added as a term of its own, so "2018" also finds "2018-19", and
+spans such as "1901-2015" split into both years.
+
+Postings are CSR arrays (indptr / docs / tf), persisted per family in
+intelligence/embedding_cache/bm25/ next to the embedding store and rebuilt
+only when the entries' text changes.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+BM25_DIR = "intelligence/embedding_cache/bm25"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-\d+)?")
+_FY_RE = re.compile(r"\b((?:19|20)\d{2})\s*[-–/]\s*((?:19|20)?\d{2})\b")
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "in", "on", "for", "to", "by", "with", "from", "at", "as", "is",
+    "are", "was", "what", "which", "how", "show", "list", "give", "me", "data", "dataset", "datasets",
+    "compare", "between", "during", "year", "years", "last", "all", "each", "per", "vs",
+}
+
+
+def _fy(m) -> str:
+    start, end = m.group(1), m.group(2)
+    if len(end) == 4 and int(end) != int(start) + 1:
+        return f"{start} {end}"     # a span of years ("1901-2015"), not a financial year
+    return f"{start}-{end[-2:]}"
+
+
+def tokenize(text: str) -> list[str]:
+    text = _FY_RE.sub(_fy, text.lower())
+    out = []
+    for tok in _TOKEN_RE.findall(text):
+        if tok in STOPWORDS:
+            continue
+        if "-" in tok:
+            out.append(tok.split("-")[0])
+        elif len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        out.append(tok)
+    return out
+
+
+def entry_text(d: dict) -> str:
+    """Title (twice) + describe columns and unique values; sample rows are left out."""
+    parts = [d.get("title", "")] * 2
+    desc = d.get("describe")
+    if isinstance(desc, dict):
+        parts += [str(c) for c in desc.get("columns", [])]
+        for col, values in (desc.get("unique_values") or {}).items():
+            parts.append(str(col))
+            parts += [str(v) for v in values]
+    elif "preview" in d:
+        parts.append(str(d["preview"]))
+    return " ".join(parts)
+
+
+class BM25Index:
+    def __init__(self, vocab: dict, indptr, docs, tf, doclen, digest: str = ""):
+        self.vocab = vocab                      # term -> posting list number
+        self.indptr, self.docs, self.tf = indptr, docs, tf
+        self.doclen = doclen
+        self.digest = digest
+        n = len(doclen)
+        self.avgdl = float(doclen.mean()) if n else 0.0
+        df = np.diff(indptr)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        # per-posting length normalisation, fixed once built
+        self._norm = (BM25_K1 * (1 - BM25_B + BM25_B * doclen[docs] / max(self.avgdl, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts: list[str], digest: str = "") -> "BM25Index":
+        postings, doclen = {}, np.zeros(len(texts), dtype=np.float32)
+        for i, text in enumerate(texts):
+            toks = tokenize(text)
+            doclen[i] = len(toks)
+            counts = {}
+            for tok in toks:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, c in counts.items():
+                postings.setdefault(tok, []).append((i, c))
+        vocab = {tok: j for j, tok in enumerate(sorted(postings))}
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        docs, tf = [], []
+        for tok, j in vocab.items():
+            plist = postings[tok]
+            indptr[j + 1] = indptr[j] + len(plist)
+            docs += [i for i, _ in plist]
+            tf += [c for _, c in plist]
+        return cls(vocab, indptr, np.array(docs, dtype=np.int64), np.array(tf, dtype=np.float32), doclen, digest)
+
+    # ---- persistence ----
+    def save(self, path: str):
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, indptr=self.indptr, docs=self.docs, tf=self.tf, doclen=self.doclen,
+                 vocab=np.array(json.dumps(self.vocab, ensure_ascii=False)), digest=np.array(self.digest))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        a = np.load(path)
+        return cls(json.loads(str(a["vocab"])), a["indptr"], a["docs"], a["tf"], a["doclen"], str(a["digest"]))
+
+    # ---- search ----
+    def search(self, query: str):
+        """
+        (bm25, coverage) per document. coverage is the idf-weighted share of
+        the query's known terms a document contains (0..1); terms the family
+        never uses don't count against it.
+        """
+        n = len(self.doclen)
+        bm25 = np.zeros(n, dtype=np.float32)
+        matched = np.zeros(n, dtype=np.float32)
+        mass = 0.0
+        for tok in set(tokenize(query)):
+            j = self.vocab.get(tok)
+            if j is None:
+                continue
+            lo, hi = self.indptr[j], self.indptr[j + 1]
+            docs, tf = self.docs[lo:hi], self.tf[lo:hi]
+            bm25[docs] += self.idf[j] * tf * (BM25_K1 + 1) / (tf + self._norm[lo:hi])
+            matched[docs] += self.idf[j]
+            mass += self.idf[j]
+        return bm25, matched / mass if mass else matched
+
+    def status(self) -> dict:
+        return {"docs": len(self.doclen), "terms": len(self.vocab), "postings": len(self.docs)}
+
+
+_indexes = {}       # family -> BM25Index
+_indexes_lock = threading.Lock()
+
+
+def lexical_index(family: str, entries: list[dict], root: str = BM25_DIR) -> BM25Index:
+    """
+    Process-wide BM25 index for `family`, loaded from disk when its text
+    digest still matches the entries and rebuilt (and saved) otherwise.
+    """
+    texts = [entry_text(d) for d in entries]
+    digest = hashlib.sha1("\x00".join(texts).encode("utf-8")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(family)
+        if index is not None and index.digest == digest:
+            return index
+        path = os.path.join(root, hashlib.sha1(family.encode("utf-8")).hexdigest()[:16] + ".npz")
+        try:
+            index = BM25Index.load(path)
+            if index.digest != digest:
+                index = None
+        except (OSError, ValueError, KeyError):
+            index = None
+        if index is None:
+            index = BM25Index.build(texts, digest)
+            os.makedirs(root, exist_ok=True)
+            index.save(path)
+            print(f"💾 BM25 index ({family}): {index.status()['terms']} terms over {len(texts)} entries")
+        _indexes[family] = index
+        return index
@@ -1,13 +1,250 @@
 # intelligence/llm_tools/local_llm.py
+"""
+Shared Ollama client used by every head and selector.
+
+- one `ollama.Client` per host, with a request timeout
+- content-addressed on-disk cache keyed by (model, options, format, messages),
+  bounded by total size (least-recently-used files evicted first)
+- per-call latency / token accounting in `LLM_USAGE`
+- model residency (keep_alive, budget-driven eviction) via `ollama_utils.residency`
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
 import ollama
 
+from .ollama_utils import residency
+
+DEFAULT_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "900"))
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", "cache/llm")
+CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+
+# one record per call: {model, latency_ms, prompt_tokens, completion_tokens, cached, swap}
+LLM_USAGE = deque(maxlen=1000)
+# per-request collector, set by the backend (copied into worker threads with the context)
+_usage_sink = contextvars.ContextVar("llm_usage_sink", default=None)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(host: str = DEFAULT_HOST, timeout: float = DEFAULT_TIMEOUT) -> ollama.Client:
+    """Process-wide ollama.Client per (host, timeout)."""
+    key = (host, timeout)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ollama.Client(host=host, timeout=timeout)
+        return _clients[key]
+
+
+def track_usage() -> list:
+    """Collect this context's call records into a fresh list and return it."""
+    sink = []
+    _usage_sink.set(sink)
+    return sink
+
+
+class PromptCache:
+    """Size-bounded, content-addressed JSON cache of LLM responses."""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_mb: float = CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(e.stat().st_size for e in self._entries())
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, messages: list, options: dict | None, fmt=None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "options": options or {}, "format": fmt},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _entries(self):
+        for sub in os.scandir(self.cache_dir):
+            if sub.is_dir():
+                yield from (e for e in os.scandir(sub.path) if e.name.endswith(".json"))
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                content = json.load(f)["content"]
+            os.utime(path)  # mark as recently used
+            self.hits += 1
+            return content
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+    def put(self, key: str, content: str, meta: dict | None = None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"content": content, "meta": meta or {}}, ensure_ascii=False)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data.encode("utf-8"))
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        target = int(self.max_bytes * 0.9)
+        for e in entries:
+            if total <= target:
+                break
+            total -= e.stat().st_size
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+        self._size = total
+
+
+_default_cache = None
+
+
+def default_cache() -> PromptCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PromptCache()
+    return _default_cache
+
+
+def choice_schema(key: str, choices: list, max_items: int | None = None) -> dict:
+    """Schema for {key: [choice, ...]} — used by the selectors to pick numbered options."""
+    items = {"type": "array", "items": {"enum": list(choices)}, "minItems": 1}
+    if max_items:
+        items["maxItems"] = max_items
+    return {"type": "object", "properties": {key: items}, "required": [key]}
+
+
 class LocalLLM:
-    def __init__(self, model: str = "qwen2.5:14b", host: str = "http://localhost:11434"):
+    def __init__(self, model: str = "qwen2.5:14b", host: str = DEFAULT_HOST,
+                 timeout: float = DEFAULT_TIMEOUT, use_cache: bool = True):
         self.model = model
         self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.use_cache = use_cache
+
+    def _messages(self, prompt, system, messages):
+        if messages is not None:
+            return list(messages)
+        msgs = [{"role": "system", "content": system}] if system else []
+        return msgs + [{"role": "user", "content": prompt}]
+
+    def _prepare(self, prompt, temperature, system, messages, options, format, cache):
+        """Build (messages, options, cache_key or None) for one call."""
+        msgs = self._messages(prompt, system, messages)
+        opts = {"temperature": temperature, **(options or {})}
+        use_cache = self.use_cache if cache is None else cache
+        use_cache = use_cache and opts.get("temperature") == 0
+        key = PromptCache.key(self.model, msgs, opts, format) if use_cache else None
+        return msgs, opts, key
+
+    def _record(self, t0, resp, cached=False, **extra):
+        rec = {
+            "model": self.model,
+            "latency_ms": round((time.perf_counter() - t0) * 1000, 3),
+            "prompt_tokens": 0 if cached else (resp.get("prompt_eval_count") or 0),
+            "completion_tokens": 0 if cached else (resp.get("eval_count") or 0),
+            "cached": cached,
+            **extra,
+        }
+        LLM_USAGE.append(rec)
+        sink = _usage_sink.get()
+        if sink is not None:
+            sink.append(rec)
+        return rec
 
-    def chat(self, prompt: str, temperature: float = 0.0, timeout: int = 2000) -> str:
+    def chat(self, prompt: str | None = None, temperature: float = 0.0, timeout: float | None = None,
+             system: str | None = None, messages: list | None = None, options: dict | None = None,
+             format=None, cache: bool | None = None, **kwargs) -> str:
         """
-        Calls Ollama's /api/generate (non-OpenAI). Returns full text.
+        Calls Ollama's /api/chat (non-OpenAI). Returns full text.
+        Responses are cached on disk unless cache=False or the sampling is non-deterministic.
         """
-        
+        msgs, opts, key = self._prepare(prompt, temperature, system, messages, options, format, cache)
+        t0 = time.perf_counter()
+        if key:
+            hit = default_cache().get(key)
+            if hit is not None:
+                self._record(t0, {}, cached=True, swap=False)
+                return hit
+
+        client = get_client(self.host, timeout or self.timeout)
+        with residency().use(self.model) as (keep_alive, swapped):
+            resp = client.chat(model=self.model, messages=msgs, options=opts, format=format,
+                               keep_alive=keep_alive, **kwargs)
+        content = ((resp.get("message", {}) or {}).get("content", "") or "").strip()
+
+        rec = self._record(t0, resp, swap=swapped)
+        if key and content:
+            default_cache().put(key, content, meta=rec)
+        return content
+
+    def chat_json(self, prompt: str | None = None, schema: dict | str = "json", **kwargs):
+        """
+        chat() with Ollama structured output (`format=schema`); returns the
+        parsed JSON, or None if the reply still isn't valid JSON.
+        """
+        raw = self.chat(prompt, format=schema, **kwargs)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            print(f"⚠️ {self.model} returned non-JSON under a schema: {raw[:200]}")
+            return None
+
+    def stream(self, prompt: str | None = None, temperature: float = 0.0, timeout: float | None = None,
+               system: str | None = None, messages: list | None = None, options: dict | None = None,
+               format=None, cache: bool | None = None, **kwargs):
+        """
+        Same as chat() but yields text pieces as Ollama produces them.
+        A cache hit is yielded as one piece. The joined pieces equal chat()'s text
+        up to surrounding whitespace.
+        """
+        msgs, opts, key = self._prepare(prompt, temperature, system, messages, options, format, cache)
+        t0 = time.perf_counter()
+        if key:
+            hit = default_cache().get(key)
+            if hit is not None:
+                self._record(t0, {}, cached=True, ttft_ms=0.0, swap=False)
+                yield hit
+                return
+
+        client = get_client(self.host, timeout or self.timeout)
+        parts, final, ttft = [], {}, None
+        with residency().use(self.model) as (keep_alive, swapped):
+            for chunk in client.chat(model=self.model, messages=msgs, options=opts, format=format,
+                                     stream=True, keep_alive=keep_alive, **kwargs):
+                piece = (chunk.get("message", {}) or {}).get("content", "") or ""
+                if piece:
+                    if ttft is None:
+                        ttft = round((time.perf_counter() - t0) * 1000, 3)
+                    parts.append(piece)
+                    yield piece
+                if chunk.get("done"):
+                    final = chunk
+
+        content = "".join(parts).strip()
+        rec = self._record(t0, final, ttft_ms=ttft, swap=swapped)
+        if key and content:
+            default_cache().put(key, content, meta=rec)
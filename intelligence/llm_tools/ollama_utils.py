@@ -1,29 +1,251 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import ollama
 import requests
 
 class OllamaManager:
-    BASE_URL = "http://localhost:11434/api"
+    HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    BASE_URL = f"{HOST}/api"
 
     @staticmethod
     def stop_all():
         """Stop all running models (safe global unload)."""
         try:
-            requests.post(f"{OllamaManager.BASE_URL}/stop", timeout=5)
+            for m in ollama.Client(host=OllamaManager.HOST, timeout=10).ps().models:
+                OllamaManager.stop_model(m.model)
             print("🧹 All Ollama models stopped.")
         except Exception as e:
             print(f"⚠️ Could not stop models: {e}")
 
     @staticmethod
-    
     def stop_model(model_name: str):
-        """Force stop a running Ollama model via CLI."""
-        import subprocess
+        """Unload a running Ollama model via the API (keep_alive=0)."""
         try:
-            subprocess.run(
-                ["ollama", "stop", model_name],
-                check=False,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            print(f"🧹 Force-stopped Ollama model: {model_name}")
+            requests.post(f"{OllamaManager.BASE_URL}/generate",
+                          json={"model": model_name, "keep_alive": 0}, timeout=30)
+            print(f"🧹 Stopped Ollama model: {model_name}")
         except Exception as e:
             print(f"⚠️ Failed to stop {model_name}: {e}")
+
+
+class ModelResidency:
+    """
+    Keeps track of which models Ollama has in RAM and decides what to evict.
+
+    Every LLM call goes through `use(model)`. At most `per_model` calls run on
+    one model at a time (Ollama queues the rest anyway, but queuing here keeps
+    timeouts honest). Models that fit in the RAM budget stay resident
+    (keep_alive is passed on each call); when a new model does not fit, the
+    least-recently-used idle model is unloaded first. Callers whose
+    model is already resident don't wait, callers that would force a swap wait
+    until the models they'd evict are idle — so concurrent work naturally
+    batches onto whatever is loaded. While a swap waits, the models it plans
+    to evict are draining: new callers of those queue behind the swap, so
+    steady load on a resident model can't starve it.
+    """
+
+    def __init__(self, budget_gb: float = float(os.getenv("MODEL_RAM_BUDGET_GB", "24")),
+                 keep_alive: str = os.getenv("MODEL_KEEP_ALIVE", "30m"),
+                 host: str = OllamaManager.HOST,
+                 per_model: int = int(os.getenv("MODEL_CONCURRENCY", "1"))):
+        self.budget = int(budget_gb * 1024 ** 3)
+        self.per_model = per_model
+        self.keep_alive = keep_alive
+        self.client = ollama.Client(host=host, timeout=900)
+        self._cond = threading.Condition()
+        self._sizes = {}        # model -> bytes (from /api/tags or /api/ps)
+        self._resident = {}     # model -> last used (monotonic)
+        self._in_use = {}       # model -> active calls
+        self._evicting = set()  # victims being unloaded (HTTP in flight, lock released)
+        self._draining = {}     # model -> swap waiters planning to evict it
+        self.swaps = 0
+        self._synced = False
+        self._syncing = False
+
+    # ------------------------------------------------------------------
+    def _fetch(self):
+        """(sizes, loaded) from the server, or None. HTTP — call without the lock."""
+        try:
+            sizes = {m.model: int(m.size or 0) for m in self.client.list().models}
+            loaded = {m.model: int(m.size or 0) for m in self.client.ps().models}
+            return sizes, loaded
+        except Exception as e:
+            print(f"⚠️ Could not query Ollama models: {e}")
+            return None
+
+    def _apply(self, fetched):
+        """Commit a _fetch() result (lock held)."""
+        if fetched is not None:
+            sizes, loaded = fetched
+            for m, size in sizes.items():
+                self._sizes.setdefault(m, size)
+            self._sizes.update(loaded)
+            now = time.monotonic()
+            self._resident = {m: self._resident.get(m, now) for m in loaded}
+        self._synced = True
+
+    def _ensure_synced(self):
+        """First caller syncs with the lock released; the others wait for it (lock held)."""
+        while not self._synced:
+            if self._syncing:
+                self._cond.wait()
+                continue
+            self._syncing = True
+            self._cond.release()
+            try:
+                fetched = self._fetch()
+            finally:
+                self._cond.acquire()
+                self._syncing = False
+            self._apply(fetched)
+            self._cond.notify_all()
+
+    def _used_bytes(self):
+        return sum(self._sizes.get(m, 0) for m in self._resident)
+
+    def _need(self, model):
+        # models already being unloaded count as freed
+        freed = sum(self._sizes.get(m, 0) for m in self._evicting)
+        return self._used_bytes() - freed + self._sizes.get(model, 0) - self.budget
+
+    def _victims(self, model):
+        """Idle resident models to unload so `model` fits, or None if it must wait."""
+        need = self._need(model)
+        victims = []
+        for m, _ in sorted(self._resident.items(), key=lambda kv: kv[1]):
+            if need <= 0:
+                break
+            if self._in_use.get(m) or m in self._evicting:
+                continue
+            victims.append(m)
+            need -= self._sizes.get(m, 0)
+        if need > 0 and any(self._in_use.values()):
+            return None
+        return victims
+
+    def _plan(self, model):
+        """Least-recently-used models (busy ones included) a waiting swap will evict."""
+        need = self._need(model)
+        plan = []
+        for m, _ in sorted(self._resident.items(), key=lambda kv: kv[1]):
+            if need <= 0:
+                break
+            if m == model or m in self._evicting:
+                continue
+            plan.append(m)
+            need -= self._sizes.get(m, 0)
+        return plan
+
+    def _mark_draining(self, models, delta):
+        for m in models:
+            n = self._draining.get(m, 0) + delta
+            if n > 0:
+                self._draining[m] = n
+            else:
+                self._draining.pop(m, None)
+
+    # ------------------------------------------------------------------
+    @contextmanager
+    def use(self, model: str):
+        """
+        Reserve `model` for one call. Yields (keep_alive, swapped) where swapped
+        is True if the model had to be loaded for this call.
+
+        Victims are chosen and marked under the lock, but unloaded with it
+        released, so callers of already-resident models never wait on a swap.
+        """
+        victims = []
+        with self._cond:
+            self._ensure_synced()
+            while (self._in_use.get(model, 0) >= self.per_model or model in self._evicting
+                   or (self._draining.get(model) and model in self._resident)):
+                self._cond.wait()
+            swapped = model not in self._resident
+            if swapped:
+                draining = []
+                try:
+                    while (victims := self._victims(model)) is None:
+                        # hold back new callers of the models this swap is waiting on
+                        self._mark_draining(draining, -1)
+                        draining = self._plan(model)
+                        self._mark_draining(draining, +1)
+                        self._cond.wait()
+                finally:
+                    if draining:
+                        self._mark_draining(draining, -1)
+                        self._cond.notify_all()
+                if self._resident or victims:
+                    self.swaps += 1
+                self._evicting.update(victims)
+            self._resident[model] = time.monotonic()
+            self._in_use[model] = self._in_use.get(model, 0) + 1
+        if victims:
+            try:
+                for m in victims:
+                    OllamaManager.stop_model(m)
+            finally:
+                with self._cond:
+                    for m in victims:
+                        self._resident.pop(m, None)
+                        self._evicting.discard(m)
+                    self._cond.notify_all()
+        try:
+            yield self.keep_alive, swapped
+        finally:
+            with self._cond:
+                self._in_use[model] -= 1
+                self._resident[model] = time.monotonic()
+                self._cond.notify_all()
+
+    def preload(self, models: list[str]):
+        """
+        Load models up-front (in order) as long as they fit the budget. Each
+        is reserved under the lock like a use() call, so concurrent calls
+        see it in the budget; preloading never evicts anything.
+        """
+        fetched = self._fetch()
+        with self._cond:
+            self._apply(fetched)
+        for model in models:
+            with self._cond:
+                if model in self._resident or model in self._evicting or self._victims(model) != []:
+                    continue
+                self._resident[model] = time.monotonic()
+                self._in_use[model] = self._in_use.get(model, 0) + 1
+            try:
+                t0 = time.perf_counter()
+                self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+                print(f"🔥 Preloaded {model} in {time.perf_counter() - t0:.1f}s")
+            except Exception as e:
+                print(f"⚠️ Preload failed for {model}: {e}")
+                with self._cond:
+                    self._resident.pop(model, None)
+            finally:
+                with self._cond:
+                    self._in_use[model] -= 1
+                    self._cond.notify_all()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "resident": list(self._resident),
+                "used_gb": round(self._used_bytes() / 1024 ** 3, 2),
+                "budget_gb": round(self.budget / 1024 ** 3, 2),
+                "swaps": self.swaps,
+            }
+
+
+_residency = None
+_residency_lock = threading.Lock()
+
+
+def residency() -> ModelResidency:
+    """Process-wide residency manager."""
+    global _residency
+    with _residency_lock:
+        if _residency is None:
+            _residency = ModelResidency()
+        return _residency
@@ -1,9 +1,13 @@
 # intelligence/llm_tools/pmkisan_selector.py
-import json, re, numpy as np
-from sentence_transformers import SentenceTransformer
-from .local_llm import LocalLLM
+import json, numpy as np
+from .embeddings import embedder, embedding_models
+from .pmkisan_index import pmkisan_index
+from .local_llm import LocalLLM, choice_schema
 import os
-import ollama
+
+# states offered to the LLM when embeddings alone can't decide
+SHORTLIST_STATES = 8
+
 
 class PMKisanSelector:
     """
@@ -13,117 +17,123 @@ class PMKisanSelector:
 
     def __init__(self, root_json, model="mistral-nemo:12b", cache_dir="intelligence/embedding_cache/"):
         self.root_json = root_json
-        # self.llm = LocalLLM(model=model)
+        self.llm = LocalLLM(model=model)
+        self.state_llm = LocalLLM(model="qwen2.5:7b")
         self.model = model
-        self.sentence_model = SentenceTransformer(
-            "./models/all-MiniLM-L6-v2",
-            device="cpu",  # or "cuda" if GPU is available
-            local_files_only=True
-        )
+        self.embedder = embedder("minilm")
         self.family_name = "Beneficiaries_(PM_KISAN)"
         self.cache_file = os.path.join(cache_dir, f"{self.family_name}.npz")
         self.states = list(root_json["states"].keys())
-        self._recompute_and_save()
+        # vectors from another backend (torch / onnx / onnx-int8) must not be reused
+        self.model_tag = embedding_models().tag("minilm")
+        if self._cache_valid():
+            self.state_vecs = np.load(self.cache_file, allow_pickle=True)["vecs"]
+        else:
+            self._recompute_and_save()
+        # district/year keys of every state, embedded at indexing time
+        self.index = pmkisan_index(root_json)
 
     # ----------------------------------------------------------------
     def _cache_valid(self):
         try:
             cached = np.load(self.cache_file, allow_pickle=True)
             cached_states = list(cached["states"])
-            return cached_states == self.states
+            return cached_states == self.states and str(cached["model"]) == self.model_tag
         except Exception:
             return False
 
     # ----------------------------------------------------------------
     def _recompute_and_save(self):
-        self.state_vecs = self.sentence_model.encode(self.states, normalize_embeddings=True)
-        np.savez(self.cache_file , vecs=self.state_vecs , states=self.states)
+        self.state_vecs = self.embedder.encode(self.states)
+        np.savez(self.cache_file , vecs=self.state_vecs , states=self.states, model=self.model_tag)
         print(f"💾 Saved new cache: {self.cache_file}")
 
 
 
     # --- Stage 1: state-level selection ---
+    def shortlist_states(self, by_district, sims, size=SHORTLIST_STATES, floor=0.15):
+        """
+        Bounded candidate list for the LLM fallback: states named through one
+        of their districts (`by_district`) first, then the closest states by embedding.
+        """
+        picks = list(by_district[:size])
+        for i in np.argsort(-sims):
+            if len(picks) >= size or (sims[i] < floor and picks):
+                break
+            if self.states[i] not in picks:
+                picks.append(self.states[i])
+        return picks
+
     def select_state(self, query, threshold=0.35):
-        qvec = self.sentence_model.encode([query], normalize_embeddings=True)[0]
+        qvec = self.embedder.encode_one(query)
         sims = np.dot(self.state_vecs, qvec)
         idx = np.argmax(sims)
         if sims[idx] < threshold:
             """
-            Let LLM pick the most relevant state index from the list.
+            Let LLM pick the most relevant state from a short list.
             Returns: {"state": <state_name>} or {"state": -1}
             """
+            by_district = self.index.states_named_by_district(query)
+            if len(by_district) == 1:
+                # an exact district name settles it
+                return {"state": by_district[0]}
+            shortlist = self.shortlist_states(by_district, sims)
 
             # Construct numbered state list
-            state_list_text = "\n".join([f"{i+1}. {s}" for i, s in enumerate(self.states)])
+            state_list_text = "\n".join([f"{i+1}. {s}" for i, s in enumerate(shortlist)])
 
             prompt = f"""
             You are a classification assistant.
             Pick the most relevant STATE INDEX from the list below based on the user query.
-            - Only return the number.
-            - If no clear match, return -1.
+            - Only return {{"state": [number]}}.
+            - If no clear match, return [-1].
 
             STATES:
             {state_list_text}
 
-            Example:
-            Q: beneficiaries in Guntur district -> 26
-            Q: farmers in Ladakh -> 32
-            Q: rainfall in Delhi -> 12
-            Q: crops in Nicobar district -> 33
+            Example (for a list "1. Kerala  2. Ladakh  3. Delhi"):
+            Q: farmers in Ladakh -> {{"state": [2]}}
+            Q: beneficiaries in Thiruvananthapuram district -> {{"state": [1]}}
 
             User query: "{query}"
             Answer:
             """
 
             try:
-                resp = ollama.chat(
-                    model="qwen2.5:7b",
-                    messages=[
-                        {"role": "system", "content": "Return only a number."},
-                        {"role": "user", "content": prompt}
-                    ],
-                ).get("message", {}).get("content", "").strip()
+                choices = list(range(1, len(shortlist) + 1)) + [-1]
+                out = self.state_llm.chat_json(prompt, choice_schema("state", choices, max_items=1),
+                                               system="Return only the JSON object.")
+                if not out:
+                    return {"state": shortlist[0]}
 
-                # Extract numbers safely
-                nums = re.findall(r"\d+", resp)
-                if not nums:
-                    return {"state": self.states[0]}
+                idx = int(out["state"][0]) - 1
+                if idx < 0 or idx >= len(shortlist):
+                    return {"state": shortlist[0]}
 
-                idx = int(nums[0]) - 1
-                if idx < 0 or idx >= len(self.states):
-                    return {"state": self.states[0]}
-
-                return {"state": self.states[idx]}
+                return {"state": shortlist[idx]}
 
             except Exception as e:
-                return {"state": self.states[0]}
+                return {"state": shortlist[0]}
 
         return {"state": self.states[idx]}
 
     # --- Stage 2: district/year/instalment selection within state ---
     def select_subfile(self, query, state):
-        # --- locate files ---
-        path = self.root_json["states"][state]
-        jsn = path[-5:]
-        file = path[:-5] + "_urls"
-        path_url = file + jsn
-
-        # --- load data ---
-        subdata = json.load(open(path))         # {'PM-KISAN': [list of district/year strings]}
-        urls_data = json.load(open(path_url))   # {'PM-KISAN': {<entry>: [url, url, ...]}}
-        urls = next(iter(urls_data.values()))   # inner dict of URL lists
-
-        # --- get the real entries ---
-        keys = next(iter(subdata.values()))     # list of "Nicobars:2022-23[11th,12th,13th]" etc.
+        # --- candidate rows: the state's slice, narrowed by exact district/year/instalment ---
+        rows = self.index.candidates(state, query)
+        if not len(rows):
+            return None
+        keys = self.index.keys
 
         # --- compute similarity ---
-        vecs = self.sentence_model.encode(keys, normalize_embeddings=True)
-        qvec = self.sentence_model.encode([query], normalize_embeddings=True)[0]
-        sims = np.dot(vecs, qvec)
-        top_idx = np.argsort(-sims)[:5]
+        qvec = self.embedder.encode_one(query)
+        sims = np.asarray(self.index.vecs[rows] @ qvec)
+        order = np.argsort(-sims)[:5]
+        top_idx = rows[order]
+        sims = dict(zip(top_idx, sims[order]))
 
         # --- hybrid logic: direct or LLM refinement ---
-        if len(top_idx) > 1 and sims[top_idx[0]] - sims[top_idx[1]] > 0.08 and sims[top_idx[0]] > 0.4:
+        if len(top_idx) == 1 or (sims[top_idx[0]] - sims[top_idx[1]] > 0.08 and sims[top_idx[0]] > 0.4):
             best_idx = top_idx[0]
         else:
             # fallback: LLM re-ranking among top-5
@@ -131,23 +141,21 @@ class PMKisanSelector:
             prompt = f"""
             The user asked: "{query}"
             Choose which of the following district/year entries best fits this query.
-            Respond ONLY with the number (e.g., 2 or 4). No explanations.
+            Respond ONLY with {{"entry": [number]}} (e.g., {{"entry": [2]}}).
 
             {candidates}
             """
             # breakpoint()
-            raw = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}]).get("message", {}).get("content", "").strip()
+            out = self.llm.chat_json(prompt, choice_schema("entry", list(range(1, len(top_idx) + 1)), max_items=1))
             # breakpoint()
-            import re
-            nums = [abs(int(n)) for n in re.findall(r"\d+", raw)]
-            best_idx = top_idx[nums[0]-1] if nums else top_idx[0]
+            best_idx = top_idx[out["entry"][0] - 1] if out else top_idx[0]
 
         # --- construct result ---
         key = keys[best_idx]
         return {
             "state": state,
             "entry": key,
-            "file_path": urls.get(key, []),  # safe dictionary access
+            "file_path": self.index.urls[best_idx],
         }
 
 
@@ -158,4 +166,6 @@ class PMKisanSelector:
             return {"selected_files": [-1]}
 
         sub_res = self.select_subfile(query, state_res["state"])
+        if sub_res is None:
+            return {"selected_files": [-1]}
         return {"selected_files": [sub_res]}
@@ -0,0 +1,196 @@
+# intelligence/llm_tools/pmkisan_index.py
+"""
+Precomputed MiniLM embeddings for every PM-KISAN "District:Year[instalments]"
+key, built once at indexing time instead of per query.
+
+Layout (intelligence/embedding_cache/pmkisan/):
+
+    vecs.npy        float32 (n_keys, dim), rows grouped by state; opened with
+                    mmap_mode="r" so only the slices touched are paged in
+    manifest.json   model, source mtimes, state -> [start, end) row range,
+                    and per-row key / district / year / instalments / urls
+
+At query time a state is a row slice; the structured columns (district,
+financial-year start, instalment bitmask) narrow that slice with exact
+filters before the dot product. Selection then needs one query encode and
+no file reads.
+
+    python -m intelligence.llm_tools.pmkisan_index    # rebuild
+"""
+
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from .embeddings import embedder, embedding_models
+
+PMKISAN_ROOT = "dataHandlers/data/sectors/Beneficiaries_(PM_KISAN).json"
+PMKISAN_INDEX_DIR = "intelligence/embedding_cache/pmkisan"
+
+_KEY_RE = re.compile(r"^(?P<district>.*):(?P<year>\d{4})-\d{2,4}\[(?P<inst>[^\]]*)\]$")
+_INST_QUERY_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)\s+instal", re.IGNORECASE)
+_FY_QUERY_RE = re.compile(r"\b((?:19|20)\d{2})(\s*[-–/]\s*\d{2,4})?\b")
+
+
+def parse_key(key: str) -> dict:
+    """'Anugul:2022-23[11th,12th,13th]' -> district, fy start, instalment bitmask."""
+    m = _KEY_RE.match(key)
+    if not m:
+        return {"district": key.split(":")[0].strip(), "year": 0, "inst": 0}
+    mask = 0
+    for n in re.findall(r"\d+", m.group("inst")):
+        mask |= 1 << int(n)
+    return {"district": m.group("district").strip(), "year": int(m.group("year")), "inst": mask}
+
+
+def _sources(root_json: dict) -> dict:
+    """state file / url file -> mtime; the index is stale when any of these changed."""
+    out = {}
+    for path in root_json["states"].values():
+        url_path = path[:-5] + "_urls" + path[-5:]
+        for p in (path, url_path):
+            try:
+                out[p] = os.path.getmtime(p)
+            except OSError:
+                out[p] = None
+    return out
+
+
+def build_pmkisan_index(root_json: dict, out_dir: str = PMKISAN_INDEX_DIR, model: str = "minilm"):
+    """Encode every key of every state and write vecs.npy + manifest.json."""
+    os.makedirs(out_dir, exist_ok=True)
+    rows, ranges = [], {}
+    for state, path in root_json["states"].items():
+        url_path = path[:-5] + "_urls" + path[-5:]
+        with open(path, encoding="utf-8") as f:
+            keys = next(iter(json.load(f).values()))
+        try:
+            with open(url_path, encoding="utf-8") as f:
+                urls = next(iter(json.load(f).values()))
+        except (OSError, ValueError, StopIteration):
+            urls = {}
+        start = len(rows)
+        for key in keys:
+            rows.append({"key": key, "state": state, **parse_key(key), "urls": urls.get(key, [])})
+        ranges[state] = [start, len(rows)]
+
+    vecs = embedder(model).encode([r["key"] for r in rows], cache=False).astype(np.float32)
+    tmp = os.path.join(out_dir, f"vecs.{os.getpid()}.tmp.npy")
+    np.save(tmp, vecs)
+    os.replace(tmp, os.path.join(out_dir, "vecs.npy"))
+    manifest = {"model": embedding_models().tag(model), "dim": int(vecs.shape[1]) if len(rows) else 0,
+                "sources": _sources(root_json), "states": ranges, "rows": rows}
+    tmp = os.path.join(out_dir, f"manifest.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(out_dir, "manifest.json"))
+    print(f"💾 PM-KISAN key index: {len(rows)} keys over {len(ranges)} states → {out_dir}")
+    return manifest
+
+
+class PMKisanIndex:
+    """Read-only view of a built index."""
+
+    def __init__(self, out_dir: str = PMKISAN_INDEX_DIR):
+        with open(os.path.join(out_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.vecs = np.load(os.path.join(out_dir, "vecs.npy"), mmap_mode="r")
+        rows = self.manifest["rows"]
+        self.model = self.manifest["model"]
+        self.ranges = {s: tuple(r) for s, r in self.manifest["states"].items()}
+        self.keys = [r["key"] for r in rows]
+        self.urls = [r["urls"] for r in rows]
+        # structured columns for exact filters
+        self.district = np.array([r["district"].lower() for r in rows], dtype=object)
+        self.year = np.array([r["year"] for r in rows], dtype=np.int32)
+        self.inst = np.array([r["inst"] for r in rows], dtype=np.int64)
+        self._district_states = {}
+        for r in rows:
+            self._district_states.setdefault(r["district"].lower(), set()).add(r["state"])
+        names = sorted((d for d in self._district_states if d), key=len, reverse=True)
+        self._district_re = re.compile(r"\b(" + "|".join(re.escape(d) for d in names) + r")\b") if names else None
+
+    def fresh(self, root_json: dict) -> bool:
+        return (self.manifest.get("sources") == _sources(root_json)
+                and self.model == embedding_models().tag("minilm"))
+
+    def states_named_by_district(self, query: str) -> list[str]:
+        """States owning a district the query names ("Nicobars district" -> A&N Islands)."""
+        if self._district_re is None:
+            return []
+        found = []
+        for m in self._district_re.finditer(query.lower()):
+            for state in sorted(self._district_states[m.group(1)]):
+                if state not in found:
+                    found.append(state)
+        return found
+
+    def candidates(self, state: str, query: str) -> np.ndarray:
+        """
+        Row numbers of `state` that survive the district / year / instalment
+        filters found in `query`. A filter that would leave nothing is skipped.
+        """
+        start, end = self.ranges.get(state, (0, 0))
+        rows = np.arange(start, end)
+        if not len(rows):
+            return rows
+        q = query.lower()
+
+        districts = {d for d in set(self.district[start:end]) if d and re.search(rf"\b{re.escape(d)}\b", q)}
+        years = set()
+        for m in _FY_QUERY_RE.finditer(query):
+            y = int(m.group(1))
+            # "2022-23" names the financial year; a bare year may be either half of one
+            years.update([y] if m.group(2) else [y, y - 1])
+        inst_mask = 0
+        for n in _INST_QUERY_RE.findall(query):
+            inst_mask |= 1 << int(n)
+
+        filters = []
+        if districts:
+            filters.append(lambda r: np.isin(self.district[r], list(districts)))
+        if years:
+            filters.append(lambda r: np.isin(self.year[r], list(years)))
+        if inst_mask:
+            filters.append(lambda r: (self.inst[r] & inst_mask) != 0)
+        for keep in filters:
+            narrowed = rows[keep(rows)]
+            if len(narrowed):
+                rows = narrowed
+        return rows
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def pmkisan_index(root_json: dict, out_dir: str = PMKISAN_INDEX_DIR) -> PMKisanIndex:
+    """
+    Process-wide index for `out_dir`; (re)built when missing or when a state
+    file changed since the last build. The freshness check runs once per process.
+    """
+    with _indexes_lock:
+        index = _indexes.get(out_dir)
+        if index is not None:
+            return index
+        try:
+            index = PMKisanIndex(out_dir)
+            if not index.fresh(root_json):
+                print("⚠️ PM-KISAN key index outdated — rebuilding...")
+                index = None
+        except (OSError, ValueError, KeyError):
+            print("🆕 No PM-KISAN key index found, building...")
+            index = None
+        if index is None:
+            build_pmkisan_index(root_json, out_dir)
+            index = PMKisanIndex(out_dir)
+        _indexes[out_dir] = index
+        return index
+
+
+if __name__ == "__main__":
+    with open(PMKISAN_ROOT, encoding="utf-8") as f:
+        build_pmkisan_index(json.load(f))
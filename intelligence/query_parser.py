@@ -0,0 +1,104 @@
+# intelligence/query_parser.py
+"""
+Extracts the parameters that tell otherwise-identical questions apart —
+states, crops, years and other numbers — and turns a query into a template
+with those slots replaced by placeholders:
+
+    "Average rainfall in Kerala since 2015"
+        → "Average rainfall in {state0} since {year0}",
+          {"state": ["Kerala"], "crop": [], "year": ["2015"], "n": []}
+
+Used by the answer cache (two queries only share an answer if their
+parameters match) and the plan library (re-binding a stored plan).
+"""
+
+import re
+
+STATES = [
+    "Andhra Pradesh", "Arunachal Pradesh", "Assam", "Bihar", "Chhattisgarh", "Goa",
+    "Gujarat", "Haryana", "Himachal Pradesh", "Jharkhand", "Karnataka", "Kerala",
+    "Madhya Pradesh", "Maharashtra", "Manipur", "Meghalaya", "Mizoram", "Nagaland",
+    "Odisha", "Punjab", "Rajasthan", "Sikkim", "Tamil Nadu", "Telangana", "Tripura",
+    "Uttar Pradesh", "Uttarakhand", "West Bengal", "Delhi", "Jammu & Kashmir", "Ladakh",
+    "Puducherry", "Andaman & Nicobar Islands", "Chandigarh", "Lakshadweep",
+    "Dadra and Nagar Haveli and Daman and Diu",
+]
+
+# matched case-insensitively, except the all-caps abbreviations
+STATE_ALIASES = {
+    "Jammu and Kashmir": "Jammu & Kashmir",
+    "Andaman and Nicobar Islands": "Andaman & Nicobar Islands",
+    "Andaman and Nicobar": "Andaman & Nicobar Islands",
+    "Orissa": "Odisha",
+    "Pondicherry": "Puducherry",
+    "Uttaranchal": "Uttarakhand",
+}
+STATE_ABBREVIATIONS = {"UP": "Uttar Pradesh", "MP": "Madhya Pradesh", "TN": "Tamil Nadu",
+                       "AP": "Andhra Pradesh", "WB": "West Bengal", "J&K": "Jammu & Kashmir"}
+
+CROPS = [
+    "rice", "paddy", "wheat", "maize", "jowar", "bajra", "ragi", "millets", "millet", "barley",
+    "gram", "tur", "arhar", "moong", "urad", "masoor", "lentil", "pulses", "groundnut",
+    "mustard", "rapeseed", "soybean", "sunflower", "sesamum", "castor", "linseed", "cotton",
+    "jute", "sugarcane", "tea", "coffee", "rubber", "coconut", "potato", "onion", "tomato",
+    "banana", "mango", "turmeric", "chilli", "cardamom", "pepper",
+]
+
+SLOTS = ("state", "crop", "year", "n")
+
+_YEAR = r"(?:19|20)\d{2}(?:\s*[-–]\s*\d{2,4})?"
+_STATE_RE = re.compile(
+    r"\b(" + "|".join(re.escape(s) for s in sorted([*STATES, *STATE_ALIASES], key=len, reverse=True)) + r")\b",
+    re.IGNORECASE)
+_ABBR_RE = re.compile(r"(?<![\w&])(" + "|".join(re.escape(a) for a in STATE_ABBREVIATIONS) + r")(?![\w&])")
+_CROP_RE = re.compile(r"\b(" + "|".join(sorted(CROPS, key=len, reverse=True)) + r")\b", re.IGNORECASE)
+_YEAR_RE = re.compile(rf"\b({_YEAR})\b")
+_NUM_RE = re.compile(r"\b(\d+(?:\.\d+)?)\b")
+
+_CANONICAL_STATE = {s.lower(): s for s in STATES}
+_CANONICAL_STATE.update({a.lower(): s for a, s in STATE_ALIASES.items()})
+
+
+def _spans(query: str):
+    """(start, end, slot, canonical value) for every parameter, left to right, non-overlapping."""
+    found = []
+    for m in _STATE_RE.finditer(query):
+        found.append((m.start(), m.end(), "state", _CANONICAL_STATE[m.group(1).lower()]))
+    for m in _ABBR_RE.finditer(query):
+        found.append((m.start(), m.end(), "state", STATE_ABBREVIATIONS[m.group(1)]))
+    for m in _CROP_RE.finditer(query):
+        found.append((m.start(), m.end(), "crop", m.group(1).lower()))
+    for m in _YEAR_RE.finditer(query):
+        found.append((m.start(), m.end(), "year", re.sub(r"\s+", "", m.group(1)).replace("–", "-")))
+    for m in _NUM_RE.finditer(query):
+        found.append((m.start(), m.end(), "n", m.group(1)))
+    found.sort(key=lambda s: (s[0], -(s[1] - s[0])))
+    spans, end = [], -1
+    for span in found:
+        if span[0] >= end:
+            spans.append(span)
+            end = span[1]
+    return spans
+
+
+def extract_params(query: str) -> dict:
+    """{slot: [distinct values in order of appearance]} for every slot in SLOTS."""
+    params = {slot: [] for slot in SLOTS}
+    for _, _, slot, value in _spans(query):
+        if value not in params[slot]:
+            params[slot].append(value)
+    return params
+
+
+def to_template(query: str):
+    """Returns (template, params); repeated values share one placeholder."""
+    params = {slot: [] for slot in SLOTS}
+    out, pos = [], 0
+    for start, end, slot, value in _spans(query):
+        if value not in params[slot]:
+            params[slot].append(value)
+        out.append(query[pos:start])
+        out.append(f"{{{slot}{params[slot].index(value)}}}")
+        pos = end
+    out.append(query[pos:])
+    return "".join(out), params
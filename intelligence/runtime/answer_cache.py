@@ -0,0 +1,188 @@
+# intelligence/runtime/answer_cache.py
+"""
+Whole-answer cache for near-duplicate questions.
+
+An entry is the replayable SSE event sequence of a finished run, keyed by
+the MiniLM embedding of its query and the versions of the files it read.
+A new query hits when
+
+  - cosine similarity to a stored query is >= threshold,
+  - its parameters (states, crops, years, numbers, other proper names)
+    are the same — "rainfall in Kerala" must not answer "rainfall in Goa",
+  - every file the stored answer used is unchanged (mtime/size for local
+    files, URL set + download time for remote ones); stale entries are
+    deleted on the spot.
+
+Entries are one JSON file each under ANSWER_CACHE_DIR.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from dataHandlers.fetchers.data_fetcher import DataFetcher
+
+from ..query_parser import extract_params
+
+ANSWER_CACHE_DIR = os.getenv("ANSWER_CACHE_DIR", "cache/answers")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+
+# events worth replaying; deltas, profiles and queue positions are per-run noise
+REPLAY_EVENTS = {"status", "next", "family", "datasets", "registry", "head1", "head2", "head3", "done"}
+
+_NAME_RE = re.compile(r"(?<!^)(?<![.?!]\s)\b([A-Z][\w&-]+)")
+
+
+def _names(query: str) -> set:
+    """Capitalised words past the sentence start (districts, schemes, agencies)."""
+    return {w.lower() for w in _NAME_RE.findall(query.strip())}
+
+
+def dataset_version(family: str, entry) -> str | None:
+    """Cheap version stamp for one selected file, or None if it can't be located."""
+    if isinstance(entry, dict) and "index" in entry:
+        matches = sorted((DataFetcher.BASE_DIR / family).glob(f"{entry['index']}.*"))
+        if not matches:
+            return None
+        st = matches[0].stat()
+        return f"{st.st_mtime_ns}:{st.st_size}"
+    if isinstance(entry, dict) and isinstance(entry.get("file_path"), list):
+        fetcher = DataFetcher()
+        parts = []
+        for url in entry["file_path"]:
+            path = fetcher._cache_path(url)
+            parts.append(f"{url}@{path.stat().st_mtime_ns if path.exists() else 0}")
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+    return None
+
+
+def selection_versions(files_res: dict) -> dict:
+    """{"family:file": version} for everything Stage-2 selected."""
+    versions = {}
+    for family_entry in files_res.get("selected_files", []):
+        for family, data in family_entry.items():
+            for entry in data.get("selected_files", []):
+                if not isinstance(entry, dict):
+                    continue
+                key = f"{family}:{entry.get('index', entry.get('entry'))}"
+                versions[key] = {"family": family, "entry": entry, "version": dataset_version(family, entry)}
+    return versions
+
+
+class AnswerCache:
+    """Embedding-keyed store of finished runs."""
+
+    def __init__(self, cache_dir: str = ANSWER_CACHE_DIR, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.entries = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in os.listdir(cache_dir):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(cache_dir, name), encoding="utf-8") as f:
+                        entry = json.load(f)
+                    self.entries[entry["id"]] = entry
+                except (OSError, ValueError, KeyError):
+                    continue
+        self._rebuild()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "param_mismatch": 0, "stale": 0}
+        self.similarities = deque(maxlen=1000)   # best similarity per lookup, for threshold tuning
+
+    def _rebuild(self):
+        self._ids = list(self.entries)
+        self._mat = (np.array([self.entries[i]["embedding"] for i in self._ids], dtype=np.float32)
+                     if self._ids else np.zeros((0, 0), dtype=np.float32))
+
+    def _path(self, entry_id: str) -> str:
+        return os.path.join(self.cache_dir, entry_id + ".json")
+
+    # ------------------------------------------------------------------
+    def lookup(self, query: str, qvec):
+        """Returns (entry or None, best similarity)."""
+        with self._lock:
+            self.stats["lookups"] += 1
+            if not self._ids:
+                self.stats["misses"] += 1
+                self.similarities.append(None)
+                return None, None
+            sims = self._mat @ np.asarray(qvec, dtype=np.float32)
+            params, names = extract_params(query), _names(query)
+            for i in np.argsort(-sims):
+                sim = float(sims[i])
+                if sim < self.threshold:
+                    break
+                entry = self.entries[self._ids[i]]
+                if entry["params"] != params or set(entry["names"]) != names:
+                    self.stats["param_mismatch"] += 1
+                    continue
+                if any(dataset_version(v["family"], v["entry"]) != v["version"]
+                       for v in entry["datasets"].values()):
+                    self.stats["stale"] += 1
+                    self._drop(entry["id"])
+                    return self._miss(sim)
+                self.stats["hits"] += 1
+                self.similarities.append(sim)
+                entry["hits"] = entry.get("hits", 0) + 1
+                return entry, sim
+            return self._miss(float(sims.max()))
+
+    def _miss(self, sim):
+        self.stats["misses"] += 1
+        self.similarities.append(sim)
+        return None, sim
+
+    def store(self, query: str, qvec, versions: dict, events: list):
+        if not versions or any(v["version"] is None for v in versions.values()):
+            return None  # can't tell later whether the data changed
+        entry = {
+            "id": hashlib.sha1(query.strip().lower().encode()).hexdigest()[:16],
+            "query": query,
+            "params": extract_params(query),
+            "names": sorted(_names(query)),
+            "embedding": [round(float(x), 6) for x in qvec],
+            "datasets": versions,
+            "events": [[e, d] for e, d in events if e in REPLAY_EVENTS],
+            "created": time.time(),
+        }
+        tmp = f"{self._path(entry['id'])}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, default=str)
+        os.replace(tmp, self._path(entry["id"]))
+        with self._lock:
+            self.entries[entry["id"]] = entry
+            for old in sorted(self.entries.values(), key=lambda e: e["created"])[: -self.max_entries]:
+                self._drop(old["id"], rebuild=False)
+            self._rebuild()
+        return entry["id"]
+
+    def _drop(self, entry_id: str, rebuild: bool = True):
+        self.entries.pop(entry_id, None)
+        try:
+            os.remove(self._path(entry_id))
+        except OSError:
+            pass
+        if rebuild:
+            self._rebuild()
+
+    def status(self) -> dict:
+        with self._lock:
+            seen = [s for s in self.similarities if s is not None]
+            return {
+                **self.stats,
+                "entries": len(self.entries),
+                "threshold": self.threshold,
+                "hit_rate": round(self.stats["hits"] / self.stats["lookups"], 3) if self.stats["lookups"] else None,
+                "mean_best_similarity": round(sum(seen) / len(seen), 4) if seen else None,
+                "recent_similarities": [None if s is None else round(s, 4) for s in list(self.similarities)[-20:]],
+            }
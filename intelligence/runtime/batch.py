@@ -0,0 +1,235 @@
+# intelligence/runtime/batch.py
+"""
+Offline batch runner for evaluation sets.
+
+Runs each pipeline stage for every query before starting the next stage,
+so all Head-1 calls hit mistral-nemo back to back, then all Head-2 calls
+hit qwen2.5:14b, and so on — one model swap per stage instead of several
+per query. Files selected by several queries are read and cleaned once
+(DatasetPool). One row per query goes to a columnar report (Parquet via
+pandas/duckdb when available, CSV otherwise).
+
+    python -m intelligence.runtime.batch queries.txt --out cache/batch/nightly.parquet
+
+A query that fails at some stage keeps its error in the report and skips
+the remaining stages; the others carry on.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from dataHandlers.fetchers.data_fetcher import DataFetcher
+
+from ..agents.head1_planner import Head1Planner
+from ..agents.head3_summarizer import Head3Answerer
+from ..agents.selfCritique import DatasetRegistry
+from ..analyzers.runAnaysis import Analyser
+from ..llm_tools.local_llm import LocalLLM, track_usage
+
+BATCH_DIR = "cache/batch"
+# HTTP-submitted jobs: at most this many run at once, this many finished ones are kept
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "1"))
+BATCH_KEEP_JOBS = int(os.getenv("BATCH_KEEP_JOBS", "50"))
+
+
+class DatasetPool:
+    """
+    Loads each selected file once per batch. Quacks like Prefetcher for
+    DataframeFetcher (take / is_prepared); every taker gets its own copy.
+    """
+
+    def __init__(self):
+        self.fetcher = DataFetcher()
+        self.frames = {}
+        self.loads = 0
+        self.reuses = 0
+        self._handed_out = set()
+
+    @staticmethod
+    def key(family, entry):
+        if isinstance(entry, dict):
+            return family, str(entry.get("index", entry.get("entry", entry.get("id"))))
+        return family, str(entry)
+
+    def take(self, family, entry):
+        key = self.key(family, entry)
+        if key in self.frames:
+            self.reuses += 1
+        else:
+            self.frames[key] = DatasetRegistry.prepare(self.fetcher.load_any(family, entry))
+            self.loads += 1
+        df = self.frames[key].copy()
+        self._handed_out.add(id(df))
+        return df
+
+    def is_prepared(self, df) -> bool:
+        return id(df) in self._handed_out
+
+
+def write_report(rows: list, path: str) -> str:
+    """Columnar report; returns the path actually written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df = pd.DataFrame(rows)
+    # nested values (selections, usage) as JSON text so every engine can store them
+    for col in df.columns:
+        if df[col].map(lambda v: isinstance(v, (dict, list))).any():
+            df[col] = df[col].map(lambda v: json.dumps(v, default=str, ensure_ascii=False))
+    if path.endswith(".parquet"):
+        try:
+            df.to_parquet(path, index=False)
+            return path
+        except ImportError:
+            try:
+                import duckdb
+                duckdb.from_df(df).write_parquet(path)
+                return path
+            except ImportError:
+                path = path[: -len(".parquet")] + ".csv"
+                print(f"⚠️ No Parquet engine installed; writing {path}")
+    df.to_csv(path, index=False)
+    return path
+
+
+class BatchRunner:
+    """Stage-major execution of many queries through one Intellegence."""
+
+    def __init__(self, intel):
+        self.intel = intel
+        self.jobs = {}          # job id -> status dict (for the POST endpoint)
+        self._jobs_lock = threading.Lock()
+
+    def _stage(self, name, states, fn):
+        """Run fn(state) for every still-healthy query, timing each."""
+        t0 = time.perf_counter()
+        for st in states:
+            if st["error"]:
+                continue
+            s0 = time.perf_counter()
+            try:
+                fn(st)
+            except Exception as e:
+                st["error"] = f"{name}: {type(e).__name__}: {e}"
+                print(f"⚠️ [{name}] {st['query'][:60]}… failed: {e}")
+            st["row"][f"{name}_ms"] = round((time.perf_counter() - s0) * 1000, 3)
+        print(f"✅ Stage {name} done for {len(states)} queries in {time.perf_counter() - t0:.1f}s")
+
+    def run(self, queries: list[str], out: str | None = None, job: dict | None = None) -> str:
+        usage = track_usage()
+        out = out or os.path.join(BATCH_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet")
+        states = [{"query": q, "error": None, "row": {"query": q}} for q in queries]
+        orch = self.intel.orchestrator()   # one set of selector models for the whole batch
+        pool = DatasetPool()
+        planner, summarizer = Head1Planner(), Head3Answerer()
+        head2 = LocalLLM(model="qwen2.5:14b")
+
+        def family(st):
+            st["family"] = orch.select_family(st["query"])
+            st["row"]["family"] = st["family"]["selected_datasets"]
+            if st["family"]["selected_datasets"] == [-1]:
+                raise ValueError("No datasets found")
+
+        def files(st):
+            st["files"] = orch.select_files(st["query"], st["family"]["selected_datasets"])
+            st["row"]["files"] = st["files"]
+
+        def registry(st):
+            st["registry"], _ = self.intel.load_registry(st["files"], pool)
+            st["row"]["shapes"] = {n: list(d.shape) for n, d in st["registry"].datasets.items()}
+
+        def head1(st):
+            st["plan"] = planner.plan(query=st["query"], registry=st["registry"]).strip()
+            st["row"]["plan"] = st["plan"]
+
+        def head2_(st):
+            prompt = self.intel.head2_prompt(st["registry"], st["plan"])
+            st["ops"] = head2.chat(prompt, format=self.intel.head2_schema(st["registry"]))
+            st["row"]["operations"] = st["ops"]
+
+        def analysis(st):
+            analyst = Analyser()
+            st["result"] = analyst.run_function_sequence(seq=st["ops"], registry=st["registry"], repair=True)
+            st["row"]["completed"] = analyst.completed
+            st["row"]["repairs"] = getattr(analyst, "repairs_used", 0)
+
+        def head3(st):
+            st["row"]["summary"] = summarizer.summarize_results(
+                registry=st["registry"], results=st["result"], query=st["query"]).strip()
+            # frames are no longer needed; keep memory flat across long batches
+            st.pop("registry", None)
+            st.pop("result", None)
+
+        stages = [("family", family), ("datasets", files), ("registry", registry),
+                  ("head1", head1), ("head2", head2_), ("analysis", analysis), ("head3", head3)]
+        for name, fn in stages:
+            if job is not None:
+                job["stage"] = name
+            self._stage(name, states, fn)
+
+        rows = []
+        for st in states:
+            st["row"]["error"] = st["error"]
+            rows.append(st["row"])
+        path = write_report(rows, out)
+        summary = {"queries": len(queries), "failed": sum(1 for s in states if s["error"]),
+                   "datasets_loaded": pool.loads, "datasets_reused": pool.reuses,
+                   "llm_calls": len(usage), "model_swaps": sum(1 for c in usage if c.get("swap")),
+                   "report": path}
+        print(f"📄 Batch report: {json.dumps(summary)}")
+        if job is not None:
+            job.update(summary)
+        return path
+
+    # ---- background jobs for the HTTP endpoint ----
+    def submit(self, queries: list[str]) -> dict | None:
+        """
+        Start a background job; None when BATCH_MAX_JOBS are already running.
+        The report always goes to BATCH_DIR/<job id> — the path is never
+        taken from the client.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job = {"id": job_id, "status": "running", "stage": None, "queries": len(queries),
+               "started": datetime.now().isoformat(timespec="seconds")}
+        with self._jobs_lock:
+            if sum(1 for j in self.jobs.values() if j["status"] == "running") >= BATCH_MAX_JOBS:
+                return None
+            # drop the oldest finished jobs (dicts keep submission order)
+            finished = [k for k, j in self.jobs.items() if j["status"] != "running"]
+            for k in finished[:max(0, len(finished) - BATCH_KEEP_JOBS + 1)]:
+                del self.jobs[k]
+            self.jobs[job_id] = job
+
+        def work():
+            try:
+                self.run(queries, out=os.path.join(BATCH_DIR, f"{job_id}.parquet"), job=job)
+                job["status"] = "done"
+            except Exception as e:
+                job.update(status="failed", error=f"{type(e).__name__}: {e}")
+
+        threading.Thread(target=work, name=f"batch-{job_id}", daemon=True).start()
+        return job
+
+
+def read_queries(path: str) -> list[str]:
+    """One query per line (.txt) or a JSON list of strings."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return [q for q in json.loads(text) if q.strip()]
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many queries stage by stage")
+    parser.add_argument("queries", help="text file (one query per line) or JSON list")
+    parser.add_argument("--out", help="report path (.parquet or .csv)")
+    args = parser.parse_args()
+
+    from ..backend import intel
+    print(BatchRunner(intel).run(read_queries(args.queries), out=args.out))
@@ -0,0 +1,258 @@
+# intelligence/runtime/ollama_standin.py
+"""
+Stand-in for the Ollama server, for benchmarking the pipeline without models.
+
+Implements the part of the API this repo uses — /api/chat (streamed or not),
+/api/generate (preload / keep_alive=0 unload), /api/tags, /api/ps — and
+answers each chat from, in order:
+
+  1. a recorded reply: the LocalLLM prompt cache (cache/llm) is keyed by
+     (model, messages, options, format), so any prompt a real run has seen
+     is replayed verbatim;
+  2. a scripted reply: the first `responses` rule of the model's profile
+     whose regex matches the last user message;
+  3. a minimal reply: the smallest value that satisfies `format` when a
+     JSON schema was requested, else the profile's `default` text.
+
+Timing follows a per-model profile: loading a model that isn't resident
+costs `load_s` (and evicts least-recently-used models past the RAM
+budget, like Ollama does), the prompt is read at `prompt_tps` and the
+reply produced at `tps` tokens/s. One request per model runs at a time.
+`--speed` scales every delay (0 = no sleeping, 0.01 = 100x faster).
+
+    python -m intelligence.runtime.ollama_standin --port 11435 --speed 0.05
+    OLLAMA_HOST=http://localhost:11435 uvicorn intelligence.backend:app
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from ..llm_tools.local_llm import PromptCache
+
+# rough CPU numbers for the models this repo runs
+DEFAULT_PROFILES = {
+    "mistral-nemo:12b": {"size_gb": 7.1, "load_s": 25.0, "prompt_tps": 60.0, "tps": 6.0},
+    "qwen2.5:14b": {"size_gb": 9.0, "load_s": 35.0, "prompt_tps": 40.0, "tps": 4.0},
+    "qwen2.5:7b": {"size_gb": 4.7, "load_s": 15.0, "prompt_tps": 90.0, "tps": 9.0},
+}
+FALLBACK_PROFILE = {"size_gb": 5.0, "load_s": 20.0, "prompt_tps": 60.0, "tps": 6.0,
+                    "default": "OK", "responses": []}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def count_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / 4))
+
+
+def minimal_json(schema, defs=None):
+    """Smallest value that satisfies the JSON schema subset used by this repo."""
+    defs = defs if defs is not None else schema.get("$defs", {}) if isinstance(schema, dict) else {}
+    if not isinstance(schema, dict):
+        return {}
+    if "$ref" in schema:
+        return minimal_json(defs.get(schema["$ref"].rsplit("/", 1)[-1], {}), defs)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return schema["enum"][0] if schema["enum"] else None
+    if "anyOf" in schema:
+        return minimal_json(schema["anyOf"][0], defs)
+    kind = schema.get("type")
+    if kind == "object":
+        props = schema.get("properties", {})
+        return {k: minimal_json(props.get(k, {}), defs) for k in schema.get("required", [])}
+    if kind == "array":
+        prefix = [minimal_json(s, defs) for s in schema.get("prefixItems", [])]
+        need = max(schema.get("minItems", 0) - len(prefix), 0)
+        return prefix + [minimal_json(schema.get("items", {}), defs) for _ in range(need)]
+    if kind == "string":
+        return "a" if schema.get("pattern") else ""
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return {}
+
+
+class StandIn:
+    """Simulated model residency, timing and reply selection."""
+
+    def __init__(self, profiles: dict | None = None, speed: float = 1.0,
+                 ram_gb: float = float(os.getenv("MODEL_RAM_BUDGET_GB", "24")),
+                 recordings: str | None = "cache/llm"):
+        self.profiles = {**DEFAULT_PROFILES, **(profiles or {})}
+        self.speed = speed
+        self.budget = ram_gb
+        self.cache = PromptCache(recordings) if recordings and os.path.isdir(recordings) else None
+        self.resident = {}      # model -> last used (monotonic)
+        self.locks = {}
+        self.stats = {"requests": 0, "recorded": 0, "scripted": 0, "minimal": 0, "loads": 0, "evictions": 0}
+
+    def profile(self, model: str) -> dict:
+        return {**FALLBACK_PROFILE, **self.profiles.get(model, {})}
+
+    async def _sleep(self, seconds: float):
+        if self.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds * self.speed)
+
+    async def load(self, model: str) -> float:
+        """Make `model` resident; returns the simulated load time in seconds."""
+        self.locks.setdefault(model, asyncio.Lock())
+        if model in self.resident:
+            self.resident[model] = time.monotonic()
+            return 0.0
+        size = self.profile(model)["size_gb"]
+        for victim, _ in sorted(self.resident.items(), key=lambda kv: kv[1]):
+            if sum(self.profile(m)["size_gb"] for m in self.resident) + size <= self.budget:
+                break
+            self.resident.pop(victim)
+            self.stats["evictions"] += 1
+        load_s = self.profile(model)["load_s"]
+        await self._sleep(load_s)
+        self.resident[model] = time.monotonic()
+        self.stats["loads"] += 1
+        return load_s
+
+    def unload(self, model: str):
+        self.resident.pop(model, None)
+
+    def reply(self, body: dict) -> str:
+        model, messages = body.get("model"), body.get("messages", [])
+        fmt = body.get("format") or None
+        if self.cache is not None:
+            hit = self.cache.get(PromptCache.key(model, messages, body.get("options"), fmt))
+            if hit is not None:
+                self.stats["recorded"] += 1
+                return hit
+        last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        prof = self.profile(model)
+        for rule in prof.get("responses", []):
+            if re.search(rule["match"], last, flags=re.IGNORECASE | re.DOTALL):
+                self.stats["scripted"] += 1
+                return rule["content"]
+        self.stats["minimal"] += 1
+        if isinstance(fmt, dict):
+            return json.dumps(minimal_json(fmt))
+        if fmt == "json":
+            return "{}"
+        return prof["default"]
+
+
+def create_app(standin: StandIn) -> FastAPI:
+    app = FastAPI(title="Ollama stand-in")
+
+    def final_fields(model, prompt_tokens, completion_tokens, load_s, prompt_s, eval_s):
+        ns = 1_000_000_000
+        return {
+            "model": model, "created_at": _now(), "done": True, "done_reason": "stop",
+            "total_duration": int((load_s + prompt_s + eval_s) * ns), "load_duration": int(load_s * ns),
+            "prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(prompt_s * ns),
+            "eval_count": completion_tokens, "eval_duration": int(eval_s * ns),
+        }
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body["model"]
+        prof = standin.profile(model)
+        standin.stats["requests"] += 1
+        content = standin.reply(body)
+        prompt_tokens = sum(count_tokens(m.get("content", "")) for m in body.get("messages", []))
+        pieces = re.findall(r"\S+\s*|\s+", content) or [""]
+        prompt_s = prompt_tokens / prof["prompt_tps"]
+        eval_s = count_tokens(content) / prof["tps"]
+
+        async def run():
+            async with standin.locks.setdefault(model, asyncio.Lock()):
+                load_s = await standin.load(model)
+                await standin._sleep(prompt_s)
+                for piece in pieces:
+                    await standin._sleep(count_tokens(piece) / prof["tps"])
+                    yield piece
+                if body.get("keep_alive") in (0, "0", "0s"):
+                    standin.unload(model)
+                yield final_fields(model, prompt_tokens, count_tokens(content), load_s, prompt_s, eval_s)
+
+        if body.get("stream", True):
+            async def ndjson():
+                async for item in run():
+                    if isinstance(item, dict):
+                        yield json.dumps({**item, "message": {"role": "assistant", "content": ""}}) + "\n"
+                    else:
+                        yield json.dumps({"model": model, "created_at": _now(), "done": False,
+                                          "message": {"role": "assistant", "content": item}}) + "\n"
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+        final = None
+        async for item in run():
+            if isinstance(item, dict):
+                final = item
+        return JSONResponse({**final, "message": {"role": "assistant", "content": content}})
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body["model"]
+        if body.get("keep_alive") in (0, "0", "0s"):
+            standin.unload(model)
+            return JSONResponse({"model": model, "created_at": _now(), "response": "", "done": True,
+                                 "done_reason": "unload"})
+        async with standin.locks.setdefault(model, asyncio.Lock()):
+            load_s = await standin.load(model)
+        return JSONResponse({"model": model, "created_at": _now(), "response": "", "done": True,
+                             "done_reason": "load", "load_duration": int(load_s * 1e9)})
+
+    def describe(model):
+        return {"model": model, "name": model, "digest": "0" * 64,
+                "size": int(standin.profile(model)["size_gb"] * 1024 ** 3),
+                "details": {"format": "gguf", "family": model.split(":")[0]}}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{**describe(m), "modified_at": _now()} for m in standin.profiles]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{**describe(m), "size_vram": 0, "expires_at": _now()} for m in standin.resident]}
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "0.0.0-standin"}
+
+    @app.get("/standin/stats")
+    async def stats():
+        return {**standin.stats, "resident": list(standin.resident)}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Ollama stand-in server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--speed", type=float, default=1.0, help="delay multiplier (0 = instant)")
+    parser.add_argument("--profile", help="JSON file: {model: {size_gb, load_s, prompt_tps, tps, default, responses}}")
+    parser.add_argument("--recordings", default="cache/llm", help="LocalLLM prompt cache to replay ('' to disable)")
+    parser.add_argument("--ram-gb", type=float, default=float(os.getenv("MODEL_RAM_BUDGET_GB", "24")))
+    args = parser.parse_args()
+
+    profiles = None
+    if args.profile:
+        with open(args.profile, encoding="utf-8") as f:
+            profiles = json.load(f)
+    standin = StandIn(profiles, speed=args.speed, ram_gb=args.ram_gb, recordings=args.recordings or None)
+    uvicorn.run(create_app(standin), host=args.host, port=args.port)
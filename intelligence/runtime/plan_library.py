@@ -0,0 +1,171 @@
+# intelligence/runtime/plan_library.py
+"""
+Library of Head-1 plans + Head-2 op sequences that already ran cleanly.
+
+Each entry is stored under the query's template (query_parser.to_template:
+states, crops and years replaced by {state0}, {crop0}, {year0}, ...) and a
+fingerprint of the registered dataset schemas. A new query reuses an entry
+when
+
+  - the registry fingerprint is identical (same D1..Dn, same columns),
+  - it has the same number of states / crops / years and the same other
+    numbers ("last 5 years" bakes 5 into computed bounds, so it can't be
+    re-bound),
+  - its template embedding is within PLAN_LIBRARY_THRESHOLD of the stored one.
+
+The stored plan and ops are then re-bound — every old state/crop/year in
+strings (case preserved) and year-valued integers is swapped for the new
+one — and go straight to Analyser, skipping both planning LLM calls.
+An entry that fails to run after re-binding is dropped.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from ..query_parser import to_template
+
+PLAN_LIBRARY_DIR = os.getenv("PLAN_LIBRARY_DIR", "cache/plans")
+PLAN_LIBRARY_THRESHOLD = float(os.getenv("PLAN_LIBRARY_THRESHOLD", "0.9"))
+
+REBIND_SLOTS = ("state", "crop", "year")
+
+
+def schema_fingerprint(datasets: dict) -> str:
+    """Hash of dataset names and their column lists."""
+    shape = [[name, [str(c) for c in getattr(df, "columns", [])]] for name, df in sorted(datasets.items())]
+    return hashlib.sha1(json.dumps(shape, ensure_ascii=False).encode()).hexdigest()[:16]
+
+
+def _match_case(found: str, new: str) -> str:
+    if found.isupper():
+        return new.upper()
+    if found.islower():
+        return new.lower()
+    return new
+
+
+def rebind(value, subs: dict):
+    """Swap every old parameter value for its new one inside ops / plan text."""
+    if not subs:
+        return value
+    if isinstance(value, str):
+        pattern = re.compile(r"(?<!\w)(" + "|".join(re.escape(o) for o in sorted(subs, key=len, reverse=True))
+                             + r")(?!\w)", re.IGNORECASE)
+        lowered = {o.lower(): n for o, n in subs.items()}
+        return pattern.sub(lambda m: _match_case(m.group(1), lowered[m.group(1).lower()]), value)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        new = subs.get(str(value))
+        return int(new) if new is not None and new.isdigit() else value
+    if isinstance(value, list):
+        return [rebind(v, subs) for v in value]
+    if isinstance(value, dict):
+        # keys are column names / argument names, never parameters
+        return {k: rebind(v, subs) for k, v in value.items()}
+    return value
+
+
+class PlanLibrary:
+    """Template + schema keyed store of validated plans."""
+
+    def __init__(self, cache_dir: str = PLAN_LIBRARY_DIR, threshold: float = PLAN_LIBRARY_THRESHOLD):
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.entries = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in os.listdir(cache_dir):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(cache_dir, name), encoding="utf-8") as f:
+                        entry = json.load(f)
+                    self.entries[entry["id"]] = entry
+                except (OSError, ValueError, KeyError):
+                    continue
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "dropped": 0}
+
+    def _path(self, entry_id: str) -> str:
+        return os.path.join(self.cache_dir, entry_id + ".json")
+
+    @staticmethod
+    def _compatible(old: dict, new: dict) -> bool:
+        return (old["n"] == new["n"]
+                and all(len(old[s]) == len(new[s]) for s in REBIND_SLOTS))
+
+    # ------------------------------------------------------------------
+    def lookup(self, query: str, tvec, fingerprint: str):
+        """
+        Returns (plan, ops, info) re-bound to `query`, or None.
+        `tvec` is the normalised embedding of the query's template.
+        """
+        _, params = to_template(query)
+        with self._lock:
+            self.stats["lookups"] += 1
+            best, best_sim = None, -1.0
+            for entry in self.entries.values():
+                if entry["fingerprint"] != fingerprint or not self._compatible(entry["params"], params):
+                    continue
+                sim = float(np.dot(entry["embedding"], tvec))
+                if sim > best_sim:
+                    best, best_sim = entry, sim
+            if best is None or best_sim < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            best["uses"] = best.get("uses", 0) + 1
+
+        subs = {}
+        for slot in REBIND_SLOTS:
+            for old, new in zip(best["params"][slot], params[slot]):
+                if old.lower() != new.lower():
+                    subs[old] = new
+        ops = rebind(copy.deepcopy(best["ops"]), subs)
+        plan = rebind(best["plan"], subs)
+        info = {"id": best["id"], "similarity": round(best_sim, 4), "template": best["template"],
+                "rebound": subs}
+        return plan, ops, info
+
+    def store(self, query: str, tvec, fingerprint: str, plan: str, ops: list):
+        template, params = to_template(query)
+        entry_id = hashlib.sha1(f"{fingerprint}|{template.lower()}".encode()).hexdigest()[:16]
+        entry = {
+            "id": entry_id,
+            "template": template,
+            "params": params,
+            "fingerprint": fingerprint,
+            "embedding": [round(float(x), 6) for x in tvec],
+            "plan": plan,
+            "ops": ops,
+            "created": time.time(),
+        }
+        tmp = f"{self._path(entry_id)}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, default=str)
+        os.replace(tmp, self._path(entry_id))
+        with self._lock:
+            self.entries[entry_id] = entry
+        return entry_id
+
+    def drop(self, entry_id: str):
+        """Forget an entry whose re-bound plan failed to run."""
+        with self._lock:
+            if self.entries.pop(entry_id, None) is not None:
+                self.stats["dropped"] += 1
+        try:
+            os.remove(self._path(entry_id))
+        except OSError:
+            pass
+
+    def status(self) -> dict:
+        with self._lock:
+            lookups = self.stats["lookups"]
+            return {**self.stats, "entries": len(self.entries), "threshold": self.threshold,
+                    "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None}
@@ -0,0 +1,104 @@
+# intelligence/runtime/prefetch.py
+"""
+Speculative dataset loading that overlaps with LLM file selection.
+
+FileSearchTool knows its embedding top-k before the re-rank LLM call
+returns. The orchestrator hands those candidates to a Prefetcher, which on a
+small background pool parses each file, applies the registry clean-up
+(`DatasetRegistry.prepare`) and warms the schema stats used by
+`describe_compact`. When the final selection is known, `take()` returns the
+ready frame (waiting if it is still loading) and `finish()` cancels or
+discards whatever the LLM did not pick.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dataHandlers.fetchers.data_fetcher import DataFetcher
+
+from ..agents.schema_prompt import SchemaRenderer
+from ..agents.selfCritique import DatasetRegistry
+
+PREFETCH_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("PREFETCH_WORKERS", "2")),
+                                   thread_name_prefix="prefetch")
+PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", "3"))
+
+
+class Prefetcher:
+    """Per-request set of speculative loads keyed by (family, file index)."""
+
+    def __init__(self, top_k: int = PREFETCH_TOP_K, pool: ThreadPoolExecutor = PREFETCH_POOL):
+        self.top_k = top_k
+        self.pool = pool
+        self.fetcher = DataFetcher()
+        self._jobs = {}          # (family, index) -> Future[(df, load_ms)]
+        self._prepared = set()   # id() of frames handed out already cleaned
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "hits": 0, "misses": 0, "cancelled": 0, "wasted": 0,
+                      "load_ms": 0.0}
+
+    @staticmethod
+    def key(family: str, entry):
+        if isinstance(entry, dict) and entry.get("index") not in (None, -1):
+            return family, entry["index"]
+        return None
+
+    def _load(self, family, entry):
+        t0 = time.perf_counter()
+        df = DatasetRegistry.prepare(self.fetcher.load_any(family, entry))
+        SchemaRenderer.warm(df)
+        return df, round((time.perf_counter() - t0) * 1000, 3)
+
+    # ------------------------------------------------------------------
+    def submit(self, family: str, candidates: list):
+        """Start loading the first top_k retrieval candidates of `family`."""
+        for entry in candidates[: self.top_k]:
+            key = self.key(family, entry)
+            if key is None:
+                continue
+            with self._lock:
+                if key in self._jobs:
+                    continue
+                entry = {"index": entry["index"], "title": entry.get("title")}
+                self._jobs[key] = self.pool.submit(self._load, family, entry)
+                self.stats["submitted"] += 1
+
+    def take(self, family: str, entry):
+        """
+        The prepared frame for `entry` if it was prefetched, else None (the
+        caller loads it itself). Blocks while a prefetch is still running.
+        """
+        key = self.key(family, entry)
+        with self._lock:
+            fut = self._jobs.pop(key, None) if key else None
+        if fut is None or fut.cancelled():
+            self.stats["misses"] += 1
+            return None
+        try:
+            df, load_ms = fut.result()
+        except Exception as e:
+            print(f"⚠️ Prefetch of {entry} failed: {e}")
+            self.stats["misses"] += 1
+            return None
+        self._prepared.add(id(df))
+        self.stats["hits"] += 1
+        self.stats["load_ms"] += load_ms
+        return df
+
+    def is_prepared(self, df) -> bool:
+        return id(df) in self._prepared
+
+    def finish(self) -> dict:
+        """Drop every prefetch the final selection did not use; returns the stats."""
+        with self._lock:
+            jobs, self._jobs = self._jobs, {}
+        for fut in jobs.values():
+            if fut.cancel():
+                self.stats["cancelled"] += 1
+            else:
+                # already parsing (or parsed); the result is simply dropped
+                self.stats["wasted"] += 1
+        self.stats["load_ms"] = round(self.stats["load_ms"], 3)
+        return dict(self.stats)
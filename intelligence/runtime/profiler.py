@@ -0,0 +1,117 @@
+# intelligence/runtime/profiler.py
+"""
+Lightweight span profiler for the analysis pipeline.
+
+Every span records wall time, CPU time and (optionally) bytes allocated via
+tracemalloc. Records are kept in memory for SSE `profile` events and appended
+to a JSONL trace file so real queries can be inspected afterwards.
+
+CPU time is process-wide by default (stage spans await work on the pandas
+pool); spans whose work runs on the entering thread pass per_thread=True
+and get time.thread_time(), which other requests' threads don't inflate.
+
+Allocation tracking (PROFILE_ALLOC=1) is off by default: tracemalloc slows
+allocation-heavy code and sees every thread, so alloc_bytes is only exact
+when one request runs at a time.
+"""
+
+import json
+import os
+import time
+import threading
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+TRACE_DIR = "cache/traces"
+PROFILE_ALLOC = os.getenv("PROFILE_ALLOC", "0") == "1"
+
+# tracemalloc is process-wide: started by the first tracking profiler, stopped by the last
+_alloc_users = 0
+_alloc_lock = threading.Lock()
+
+
+def frame_shape(val):
+    """(rows, cols) for a DataFrame-like value, else None."""
+    shape = getattr(val, "shape", None)
+    if shape is None:
+        return None
+    return [int(shape[0]), int(shape[1]) if len(shape) > 1 else 1]
+
+
+class Profiler:
+    """Collects timing spans for one request."""
+
+    def __init__(self, request_id: str | None = None, trace_dir: str = TRACE_DIR,
+                 track_alloc: bool = False):
+        global _alloc_users
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.trace_dir = trace_dir
+        self.track_alloc = track_alloc
+        self.records = []
+        if track_alloc:
+            with _alloc_lock:
+                if _alloc_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                _alloc_users += 1
+
+    def close(self):
+        """Stop allocation tracking for this profiler (idempotent)."""
+        global _alloc_users
+        if not self.track_alloc:
+            return
+        self.track_alloc = False
+        with _alloc_lock:
+            _alloc_users -= 1
+            if _alloc_users == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    @contextmanager
+    def span(self, name: str, kind: str = "stage", per_thread: bool = False, **meta):
+        """
+        Time the enclosed block. Yields the record dict so callers can attach
+        extra fields (rows, cols, copies, ...) before it is stored.
+        """
+        rec = {"request_id": self.request_id, "kind": kind, "name": name, **meta}
+        track = self.track_alloc and tracemalloc.is_tracing()
+        if track:
+            tracemalloc.reset_peak()
+            mem0, _ = tracemalloc.get_traced_memory()
+        cpu_clock = time.thread_time if per_thread else time.process_time
+        wall0, cpu0 = time.perf_counter(), cpu_clock()
+        try:
+            yield rec
+        except Exception as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            rec["wall_ms"] = round((time.perf_counter() - wall0) * 1000, 3)
+            rec["cpu_ms"] = round((cpu_clock() - cpu0) * 1000, 3)
+            if track:
+                mem1, peak = tracemalloc.get_traced_memory()
+                rec["alloc_bytes"] = max(0, peak - mem0)
+                rec["retained_bytes"] = mem1 - mem0
+            self.records.append(rec)
+
+    def summary(self) -> dict:
+        """Totals per kind plus the slowest span."""
+        stages = [r for r in self.records if r["kind"] == "stage"]
+        slowest = max(self.records, key=lambda r: r["wall_ms"], default=None)
+        return {
+            "request_id": self.request_id,
+            "stages_wall_ms": round(sum(r["wall_ms"] for r in stages), 3),
+            "steps": sum(1 for r in self.records if r["kind"] == "step"),
+            "slowest": slowest and {"name": slowest["name"], "wall_ms": slowest["wall_ms"]},
+        }
+
+    def write(self, path: str | None = None) -> str:
+        """Append all records as JSON lines; returns the trace path."""
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = path or os.path.join(
+            self.trace_dir, f"{datetime.now().strftime('%Y%m%d')}.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            for rec in self.records:
+                f.write(json.dumps(rec, default=str) + "\n")
+        self.close()
+        return path
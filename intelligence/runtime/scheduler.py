@@ -0,0 +1,132 @@
+# intelligence/runtime/scheduler.py
+"""
+Async plumbing for the FastAPI backend.
+
+- RequestGate: bounded admission queue (N running pipelines, M waiting);
+  callers beyond M get None (→ "busy" SSE event), waiters see their queue
+  position. Tickets are taken inside the response generator, so a stream
+  that never starts never holds one.
+- run_cpu: runs blocking pandas/IO work on a dedicated thread pool so the
+  event loop (and the SSE streams of other users) never stall.
+- iterate_in_thread: drives a blocking generator (LLM token stream) in a
+  worker thread and exposes it as an async iterator.
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CPU_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("PANDAS_WORKERS", "4")),
+                              thread_name_prefix="pandas")
+
+_DONE = object()
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) on CPU_POOL, keeping the caller's contextvars."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(CPU_POOL, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def iterate_in_thread(make_gen, maxsize: int = 256):
+    """
+    Async-iterate a blocking generator. `make_gen` is called inside the worker
+    thread (so any setup it does is off the loop too). Closing the async
+    iterator early stops the producer at its next item.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    ctx = contextvars.copy_context()
+
+    def produce():
+        try:
+            for item in make_gen():
+                if stop.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        except BaseException as e:  # surfaced to the consumer
+            asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+        finally:
+            asyncio.run_coroutine_threadsafe(queue.put(_DONE), loop).result()
+
+    loop.run_in_executor(None, ctx.run, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full queue
+        while not queue.empty():
+            queue.get_nowait()
+
+
+class RequestGate:
+    """At most `max_active` pipelines run at once; at most `max_queued` wait."""
+
+    def __init__(self, max_active: int = int(os.getenv("MAX_ACTIVE_REQUESTS", "2")),
+                 max_queued: int = int(os.getenv("MAX_QUEUED_REQUESTS", "8"))):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = set()
+        self.waiting = []       # FIFO of tickets
+        self._ids = itertools.count(1)
+        self._cond = None       # created lazily on the serving loop
+
+    def _condition(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def try_enqueue(self):
+        """Reserve a place in line; None if the queue is full."""
+        if len(self.waiting) >= self.max_queued:
+            return None
+        ticket = next(self._ids)
+        self.waiting.append(ticket)
+        return ticket
+
+    def position(self, ticket) -> int:
+        return self.waiting.index(ticket) + 1 if ticket in self.waiting else 0
+
+    async def wait(self, ticket):
+        """Async-iterate queue positions until `ticket` is admitted."""
+        cond = self._condition()
+        last = None
+        while True:
+            async with cond:
+                while True:
+                    if self.waiting and self.waiting[0] == ticket and len(self.active) < self.max_active:
+                        self.waiting.pop(0)
+                        self.active.add(ticket)
+                        cond.notify_all()
+                        return
+                    pos = self.position(ticket)
+                    if pos != last:
+                        break
+                    await cond.wait()
+            # yield outside the lock so a slow client can't hold up the queue
+            last = pos
+            yield pos
+
+    async def release(self, ticket):
+        cond = self._condition()
+        async with cond:
+            self.active.discard(ticket)
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+            cond.notify_all()
+
+    def status(self) -> dict:
+        return {"active": len(self.active), "queued": len(self.waiting),
+                "max_active": self.max_active, "max_queued": self.max_queued}